@@ -9,7 +9,17 @@ from config import is_admin, app_settings, SERVERS_CFG
 from loguru import logger
 import textwrap
 import asyncio
+import html
+import time
 from services.telegram_utils import safe_send
+from services.send_queue import ADMIN
+from services.progress import MessageRef
+from services import jobs
+from services.link_cache import links, tg_id_of
+from services.inventory import inventory, anchor_key
+from services.fleet import run_fleet_view
+from services.presence import presence
+from services import migration
 from db import get_selected, set_selected
 from sync_reminders import sync_reminders
 from services.core import get_best_server_cfg, get_or_create_user_key, delete_user_profile, get_user_traffic, server_manager
@@ -17,7 +27,6 @@ from services import admin_settings
 from aiogram.exceptions import TelegramBadRequest
 from datetime import datetime, timedelta
 from services.server_manager import _to_gb
-from dataclasses import dataclass
 from api.http import build_vless, api_auth, api_clients, api_create_client, api_delete_client, api_inbounds_list, api_traffic, api_onlines
 from httpx import HTTPStatusError
 from .admin_broadcast import router as admin_broadcast_router
@@ -27,13 +36,6 @@ class AdminFSM(StatesGroup):
     waiting_add = State()
     waiting_del = State()
 
-@dataclass
-class ClientCard:
-    uuid: str
-    email: str
-    inbound_id: int
-    page: int
-
 async def get_admin_selected_sid(state: FSMContext, uid: int) -> str:
     sid = (await state.get_data()).get("selected_server")
     if sid:
@@ -56,64 +58,136 @@ def register_admin_handlers(dp):
         if not is_admin(msg.from_user):
             return await msg.answer("⛔ Доступ запрещён.")
         sid = await get_admin_selected_sid(state, msg.from_user.id)
-        try:
-            online = len(await server_manager.get_online_clients(sid))
-        except Exception:
-            online = 0
+        online = presence.online_count(sid)
         menu_title = f"Меню администратора (сервер: {sid})"
         kb = admin_menu_keyboard(sid, online)
         await msg.answer(menu_title, reply_markup=kb)
 
-    @dp.callback_query(F.data == "admin_clients")
+    @dp.callback_query(F.data == "admin_clients", flags={"panel": True})
     async def cb_admin_clients(query: CallbackQuery, state: FSMContext):
         await query.answer()
         sid = await get_admin_selected_sid(state, query.from_user.id)
         try:
-            clients = await server_manager.list_clients(sid)
-            # logger.info(f"Клиенты-ответ ({sid}): {clients}")
-            if not clients:
-                text = "Нет клиентов."
-            else:
-                lines = [f"{i+1}. <code>{c['email']}</code>" for i, c in enumerate(clients)]
-                text = "<b>Все клиенты:</b>\n" + "\n".join(lines)
-            kb = InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
-            await safe_send(query.message.answer, text, parse_mode="HTML", reply_markup=kb)
+            snap = await inventory.get(sid)
         except Exception as e:
             logger.error(f"Ошибка списка клиентов ({sid}): {e}")
             kb = InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
-            await safe_send(query.message.answer, f"Ошибка: {e}", reply_markup=kb)
+            return await safe_send(query.message.answer, f"Ошибка: {e}", reply_markup=kb, priority=ADMIN)
+        text, kb = render_clients_page(snap, snap.page(0, LIST_PAGE))
+        await safe_send(query.message.answer, text, parse_mode="HTML", reply_markup=kb, priority=ADMIN)
+
+    @dp.callback_query(F.data.startswith("cl:"), flags={"panel": True})
+    async def cb_clients_page(query: CallbackQuery):
+        if not is_admin(query.from_user):
+            return await query.answer("⛔ Доступ запрещён.", show_alert=True)
+        # cl:<sid>:<n|p>:<позиция>:<anchor_key email> — страница после/до клиента
+        parts = query.data.split(":")
+        if len(parts) != 5 or parts[1] not in SERVERS_CFG or not parts[3].isdigit():
+            return await query.answer("Список устарел, откройте заново", show_alert=True)
+        _, sid, direction, pos, key = parts
+        await query.answer()
+        snap = await inventory.get(sid)
+        anchor = snap.resolve(key)
+        if anchor is not None:
+            rows = snap.after(anchor, LIST_PAGE) if direction == "n" else snap.before(anchor, LIST_PAGE)
+        else:
+            # Клиента-якоря уже нет: страница от его прежней позиции
+            i = min(int(pos), len(snap))
+            rows = snap.clients[i:i + LIST_PAGE] if direction == "n" else snap.clients[max(0, i - LIST_PAGE):i]
+        text, kb = render_clients_page(snap, rows)
+        await safe_send(query.message.edit_text, text, parse_mode="HTML", reply_markup=kb, silent=True, priority=ADMIN)
+
+    @dp.message(Command("find"), flags={"panel": True})
+    async def cmd_find(msg: types.Message):
+        if not is_admin(msg.from_user):
+            return
+        #  /find [сервер] префикс — по email, имени, tg_id или uuid; без сервера — по всем
+        args = msg.text.split()[1:]
+        scope = args.pop(0) if len(args) > 1 and args[0] in SERVERS_CFG else "*"
+        if not args:
+            return await safe_send(msg.answer, "Использование: <code>/find [сервер] префикс</code>", parse_mode="HTML", priority=ADMIN)
+        # Префикс уходит в callback_data: ищем сразу по обрезанному, чтобы страницы совпадали
+        text, kb = await render_search_page(scope, fit_prefix(scope, args[0]), 0)
+        await safe_send(msg.answer, text, parse_mode="HTML", reply_markup=kb, priority=ADMIN)
+
+    @dp.callback_query(F.data.startswith("fd:"), flags={"panel": True})
+    async def cb_find_page(query: CallbackQuery):
+        if not is_admin(query.from_user):
+            return await query.answer("⛔ Доступ запрещён.", show_alert=True)
+        # fd:<scope>:<offset>:<префикс>
+        parts = query.data.split(":", 3)
+        if len(parts) != 4 or (parts[1] != "*" and parts[1] not in SERVERS_CFG) or not parts[2].isdigit():
+            return await query.answer("Список устарел, выполните /find заново", show_alert=True)
+        _, scope, offset, prefix = parts
+        await query.answer()
+        text, kb = await render_search_page(scope, prefix, int(offset))
+        await safe_send(query.message.edit_text, text, parse_mode="HTML", reply_markup=kb, silent=True, priority=ADMIN)
 
     @dp.callback_query(F.data == "admin_traffic")
     async def cb_admin_traffic(q: CallbackQuery, state: FSMContext):
         await q.answer()
         sid = await get_admin_selected_sid(state, q.from_user.id)
-        placeholder = await safe_send(q.message.edit_text, "⏳ Синхронизация…", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        try:
-            clients = await server_manager.list_clients(sid)
-        except Exception as e:
-            return await placeholder.edit_text(f"Ошибка получения списка клиентов: {e}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        if not clients:
-            return await placeholder.edit_text("❗ Клиентов нет.", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+        placeholder = await safe_send(q.message.edit_text, "⏳ Синхронизация…", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
+        await jobs.submit(q.bot, "traffic_report", MessageRef.of(placeholder), sid)
+
+    @dp.callback_query(F.data == "admin_fleet")
+    async def cb_admin_fleet(q: CallbackQuery):
+        if not is_admin(q.from_user):
+            return await q.answer("⛔ Доступ запрещён.", show_alert=True)
+        await q.answer()
+        await run_fleet_view(q.message)
+
+    @dp.message(Command("fleet"))
+    async def cmd_fleet(msg: types.Message):
+        if not is_admin(msg.from_user):
+            return
+        placeholder = await safe_send(msg.answer, "⏳ Опрашиваю серверы…", priority=ADMIN)
+        await run_fleet_view(placeholder)
+
+    @dp.message(Command("traffic"))
+    async def cmd_traffic(msg: types.Message, state: FSMContext):
+        if not is_admin(msg.from_user):
+            return
+        #  /traffic [сервер|all] — CSV-отчёт; без аргумента — выбранный сервер
+        arg = (msg.text.split()[1:] or [""])[0]
+        sid = "*" if arg == "all" else arg if arg in SERVERS_CFG else await get_admin_selected_sid(state, msg.from_user.id)
+        placeholder = await safe_send(msg.answer, "⏳ Готовлю отчёт…", priority=ADMIN)
+        await jobs.submit(msg.bot, "traffic_report", MessageRef.of(placeholder), sid)
+
+    @dp.message(Command("migrate"), flags={"panel": True})
+    async def cmd_migrate(msg: types.Message):
+        if not is_admin(msg.from_user):
+            return
+        #  /migrate [drain <сервер>] — план (dry-run)
+        #  /migrate run [drain <сервер>] [N] — сохранить план и выполнить
+        #  /migrate resume — продолжить незавершённые; /migrate status
+        args = msg.text.split()[1:]
+        action = args.pop(0) if args and args[0] in ("run", "resume", "status") else "plan"
+        if action == "status":
+            return await safe_send(msg.answer, await migration.status_text(), priority=ADMIN)
+        if action == "resume":
+            placeholder = await safe_send(msg.answer, "⏳ Продолжаю перенос…", priority=ADMIN)
+            return await jobs.submit(msg.bot, "migration", MessageRef.of(placeholder), None)
+        drain = None
+        if len(args) >= 2 and args[0] == "drain":
+            if args[1] not in SERVERS_CFG:
+                return await safe_send(msg.answer, f"Неизвестный сервер: {html.escape(args[1])}", priority=ADMIN)
+            drain = args[1]
+            args = args[2:]
+        max_moves = int(args[0]) if args and args[0].isdigit() else None
+        if action == "plan":
+            moves = await migration.plan(max_moves, drain)
+            text = migration.plan_text(moves)
+            return await safe_send(msg.answer, text + (f"\n\nВыполнить: /migrate run{f' drain {drain}' if drain else ''}" if moves else ""), priority=ADMIN)
         try:
-            stats = await asyncio.gather(*(server_manager.get_traffic(sid, c) for c in clients))
-        except Exception as e:
-            return await placeholder.edit_text(f"Ошибка получения трафика: {e}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        total_up = total_dn = 0
-        rows = []
-        for c, stat in zip(clients, stats):
-            up, dn = stat["uplink"], stat["downlink"]
-            total_up += up; total_dn += dn
-            name = c.get('email') or c.get('username') or c.get('remark', 'unknown')
-            rows.append(f"• <code>{name}</code> ⬆ {server_manager.to_gb(up):.2f} ГБ ⬇ {server_manager.to_gb(dn):.2f} ГБ")
-        head = (
-            f"<b>Трафик {sid}</b>\n"
-            f"Σ ⬆ {server_manager.to_gb(total_up):.2f} ГБ ⬇ {server_manager.to_gb(total_dn):.2f} ГБ\n\n"
-        )
-        await placeholder.edit_text(
-            head + "\n".join(rows),
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]),
-        )
+            plan_id, moves = await migration.create_plan(max_moves, drain)
+        except migration.MigrationBusy as e:
+            return await safe_send(msg.answer, str(e), priority=ADMIN)
+        text = migration.plan_text(moves)
+        if plan_id is None:
+            return await safe_send(msg.answer, text, priority=ADMIN)
+        placeholder = await safe_send(msg.answer, f"⏳ План {plan_id}\n{text}", priority=ADMIN)
+        await jobs.submit(msg.bot, "migration", MessageRef.of(placeholder), plan_id)
 
     @dp.callback_query(F.data == "admin_select_server")
     async def admin_select_server(query: CallbackQuery, state: FSMContext):
@@ -146,25 +220,15 @@ def register_admin_handlers(dp):
     @dp.callback_query(F.data == "admin_sync_reminders")
     async def admin_sync_reminders(query: CallbackQuery, state: FSMContext):
         await query.answer()
-        placeholder = await safe_send(query.message.edit_text, "⏳ Синхронизация…", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        total = 0
-        for s in SERVERS_CFG:
-            try:
-                count = await sync_reminders(SERVERS_CFG[s])
-                total += count
-            except Exception as e:
-                logger.warning(f"Ошибка синхронизации {s}: {e}")
-        await placeholder.edit_text(f"Синхронизировано {total} новых пользователей.")
+        placeholder = await safe_send(query.message.edit_text, "⏳ Синхронизация…", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
+        await jobs.submit(query.bot, "sync_reminders", MessageRef.of(placeholder))
 
     @dp.callback_query(F.data == "admin_menu")
     async def cb_admin_menu(query: CallbackQuery, state: FSMContext):
         await query.answer()
         try:
             sid = await get_admin_selected_sid(state, query.from_user.id)
-            try:
-                online = len(await server_manager.get_online_clients(sid))
-            except Exception:
-                online = 0
+            online = presence.online_count(sid)
             await query.message.edit_text("Меню администратора:", reply_markup=admin_menu_keyboard(sid, online))
         except TelegramBadRequest as e:
             if "message is not modified" in str(e):
@@ -176,17 +240,25 @@ def register_admin_handlers(dp):
     async def cb_admin_onlines(q: CallbackQuery, state: FSMContext):
         await q.answer()
         sid = await get_admin_selected_sid(state, q.from_user.id)
-        try:
-            online_list = await server_manager.get_online_clients(sid)
-            online = len(online_list)
-        except Exception as e:
-            return await q.message.edit_text(f"Ошибка получения онлайна: {e}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+        online_list = presence.online(sid)
+        if online_list is None:
+            # Трекер ещё не опросил сервер — разово спрашиваем панель
+            try:
+                online_list = await server_manager.get_online_clients(sid)
+            except Exception as e:
+                return await q.message.edit_text(f"Ошибка получения онлайна: {e}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
         if not online_list:
             text = f"Нет подключённых клиентов на {sid}."
         else:
-            names = "\n".join(f"• {email}" for email in online_list)
-            text = f"Он-лайн на {sid} ({online}):\n{names}"
-        await q.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+            names = "\n".join(f"• {html.escape(email)}" for email in sorted(online_list)[:50])
+            text = f"Он-лайн на {sid} ({len(online_list)}):\n{names}"
+        recent = presence.recently_offline(sid)
+        if recent:
+            text += "\n\nНедавно были:\n" + "\n".join(f"• {html.escape(email)} — {humanize_last_seen(ts)}" for email, ts in recent)
+        age = presence.age(sid)
+        if age is not None:
+            text += f"\n\n<i>обновлено {humanize_last_seen(time.time() - age)}</i>"
+        await q.message.edit_text(text, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
 
     @dp.callback_query(F.data == "admin_actions_menu")
     async def admin_actions_menu(query: CallbackQuery, state: FSMContext):
@@ -203,10 +275,7 @@ def register_admin_handlers(dp):
     async def admin_back(query: CallbackQuery, state: FSMContext):
         await query.answer()
         sid = await get_admin_selected_sid(state, query.from_user.id)
-        try:
-            online = len(await server_manager.get_online_clients(sid))
-        except Exception:
-            online = 0
+        online = presence.online_count(sid)
         menu_title = f"Меню администратора (сервер: {sid})"
         try:
             await query.message.edit_text(menu_title, reply_markup=admin_menu_keyboard(sid, online))
@@ -216,7 +285,7 @@ def register_admin_handlers(dp):
             else:
                 raise
 
-    @dp.callback_query(F.data == "admin_add")
+    @dp.callback_query(F.data == "admin_add", flags={"panel": True})
     async def admin_add_start(query: CallbackQuery, state: FSMContext):
         await query.answer()
         sid = await get_admin_selected_sid(state, query.from_user.id)
@@ -230,7 +299,7 @@ def register_admin_handlers(dp):
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
         )
 
-    @dp.message(AdminFSM.waiting_add)
+    @dp.message(AdminFSM.waiting_add, flags={"panel": True})
     async def admin_add_process(msg: types.Message, state: FSMContext):
         data = await state.get_data()
         sid = data.get("selected_server")
@@ -238,112 +307,87 @@ def register_admin_handlers(dp):
         # Валидация имени (как у пользователя)
         import re
         if not re.fullmatch(r"[a-z]{3,20}", email):
-            return await safe_send(msg.answer, "❗️ Имя должно быть 3–20 английских букв (a-z).", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+            return await safe_send(msg.answer, "❗️ Имя должно быть 3–20 английских букв (a-z).", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
         clients = await server_manager.list_clients(sid)
         # Проверка уникальности имени/email
         if any(c["email"].lower() == email for c in clients):
-            return await safe_send(msg.answer, f"❗️ Клиент с именем <code>{email}</code> уже существует.", parse_mode="HTML", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        placeholder = await safe_send(msg.answer, "⏳ Добавляю клиента…", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        inbound_id = clients[0]["inbound_id"] if clients else 1
+            return await safe_send(msg.answer, f"❗️ Клиент с именем <code>{email}</code> уже существует.", parse_mode="HTML", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
+        placeholder = await safe_send(msg.answer, "⏳ Добавляю клиента…", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
         try:
+            inbound_id = await server_manager.pick_inbound(sid)
             await server_manager.create_client(sid, inbound_id, email, 0, skip_limit=is_admin(msg.from_user))
+            inventory.invalidate(sid)
             server_cfg = SERVERS_CFG[sid]
             vless_link = build_vless(server_cfg, email)
-            await safe_send(placeholder.edit_text, f"✅ Клиент <code>{email}</code> добавлен.", parse_mode="HTML")
-            await safe_send(msg.answer, f"<code>{vless_link}</code>", parse_mode="HTML", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+            await safe_send(placeholder.edit_text, f"✅ Клиент <code>{email}</code> добавлен.", parse_mode="HTML", priority=ADMIN)
+            await safe_send(msg.answer, f"<code>{vless_link}</code>", parse_mode="HTML", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
         except Exception as e:
-            await safe_send(placeholder.edit_text, f"Ошибка добавления: {e}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+            await safe_send(placeholder.edit_text, f"Ошибка добавления: {e}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]), priority=ADMIN)
         await state.clear()
 
-    @dp.callback_query(F.data == "admin_del")
+    @dp.message(Command("bulkadd"))
+    async def admin_bulk_add(msg: types.Message, state: FSMContext):
+        if not is_admin(msg.from_user):
+            return
+        #  /bulkadd name1 name2 … — на выбранный сервер
+        import re
+        names = [n.lower() for n in msg.text.split()[1:]]
+        bad = [n for n in names if not re.fullmatch(r"[a-z]{3,20}", n)]
+        if not names or bad:
+            return await safe_send(msg.answer, "Использование: <code>/bulkadd имя1 имя2 …</code> (3–20 букв a-z)" + (f"\nНекорректные: {', '.join(bad)}" if bad else ""), parse_mode="HTML", priority=ADMIN)
+        sid = await get_admin_selected_sid(state, msg.from_user.id)
+        placeholder = await safe_send(msg.answer, f"⏳ Создаю {len(names)} клиентов на {sid}…", priority=ADMIN)
+        await jobs.submit(msg.bot, "provision", MessageRef.of(placeholder), sid, list(dict.fromkeys(names)))
+
+    @dp.callback_query(F.data == "admin_del", flags={"panel": True})
     async def admin_del_start(query: CallbackQuery, state: FSMContext):
         await query.answer()
         sid = await get_admin_selected_sid(state, query.from_user.id)
-        all_clients = await server_manager.list_clients(sid)
-        if not all_clients:
+        snap = await inventory.get(sid)
+        if not len(snap):
             return await query.message.edit_text("Нет клиентов для удаления.", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
-        cards = [ClientCard(
-            uuid=c["uuid"],
-            email=c["email"],
-            inbound_id=c["inbound_id"],
-            page=idx // 5
-        ) for idx, c in enumerate(all_clients)]
-        pages = {}
-        for card in cards:
-            pages.setdefault(card.page, []).append(card)
-        await state.update_data(del_pages=pages, del_cur=0, del_sid=sid)
-        await show_delete_page(query.message, pages[0], 0, len(pages))
-
-    @dp.callback_query(F.data.startswith("prev_del:"))
-    async def cb_prev_del(q: CallbackQuery, state: FSMContext):
-        page = int(q.data.split(":")[1])
-        data = await state.get_data()
-        await state.update_data(del_cur=page)
-        await show_delete_page(q.message, data["del_pages"][page], page, len(data["del_pages"]))
+        # В FSM только курсор: сервер, версия снимка, смещение и первый email страницы
+        await state.update_data(del_sid=sid)
+        await save_del_cursor(state, snap, 0)
+        await show_delete_page(query.message, snap, 0)
 
-    @dp.callback_query(F.data.startswith("next_del:"))
-    async def cb_next_del(q: CallbackQuery, state: FSMContext):
-        page = int(q.data.split(":")[1])
+    @dp.callback_query(F.data.startswith("prev_del:") | F.data.startswith("next_del:"))
+    async def cb_page_del(q: CallbackQuery, state: FSMContext):
+        target = int(q.data.split(":")[1])
         data = await state.get_data()
-        await state.update_data(del_cur=page)
-        await show_delete_page(q.message, data["del_pages"][page], page, len(data["del_pages"]))
+        snap = await inventory.get(data["del_sid"])
+        # Смещение из кнопки посчитано по старому снимку — переносим сдвиг относительно якоря
+        offset = clamp_offset(resolve_del_offset(data, snap) + target - data["del_off"], len(snap))
+        await save_del_cursor(state, snap, offset)
+        await show_delete_page(q.message, snap, offset)
 
-    @dp.callback_query(F.data.startswith("del_"))
+    @dp.callback_query(F.data.startswith("del_"), flags={"panel": True})
     async def cb_del_client(q: CallbackQuery, state: FSMContext):
         uuid = q.data.split("_", 1)[1]
         data = await state.get_data()
-        page = data["del_cur"]
         sid = data["del_sid"]
-        card = next((c for c in data["del_pages"][page] if str(c.uuid) == str(uuid)), None)
-        if not card:
-            # Попробуем обновить список и найти клиента во всех страницах
-            all_clients = await server_manager.list_clients(sid)
-            cards = [ClientCard(
-                uuid=c["uuid"],
-                email=c["email"],
-                inbound_id=c["inbound_id"],
-                page=idx // 5
-            ) for idx, c in enumerate(all_clients)]
-            pages = {}
-            for card_ in cards:
-                pages.setdefault(card_.page, []).append(card_)
-            found = False
-            for p, cards_on_page in pages.items():
-                card = next((c for c in cards_on_page if str(c.uuid) == str(uuid)), None)
-                if card:
-                    page = p
-                    found = True
-                    break
-            if not found:
-                return await q.answer("Клиент не найден", show_alert=True)
-            await state.update_data(del_pages=pages, del_cur=page)
+        snap = await inventory.get(sid)
+        offset = resolve_del_offset(data, snap)
+        # Обычно клиент на текущей странице; иначе — через индекс по uuid
+        client = next((c for c in snap.page(offset, DEL_PAGE) if str(c["uuid"]) == uuid), None)
+        if client is None:
+            client = next((c for c in snap.search(uuid) if str(c["uuid"]) == uuid), None)
+        if client is None:
+            return await q.answer("Клиент не найден", show_alert=True)
         try:
-            await server_manager.delete_client(sid, card.inbound_id, card.uuid)
+            await server_manager.delete_client(sid, client["inbound_id"], client["uuid"])
             await server_manager.invalidate_cache(sid, "clients")
+            links.invalidate(tg_id_of(client["email"]))
+            inventory.remove(sid, client["email"])
             # Всплывающее окно с именем клиента
-            await q.answer(f"✅ Клиент {card.email} удалён", show_alert=True)
-            # Обновляем список после удаления
-            all_clients = await server_manager.list_clients(sid)
-            cards = [ClientCard(
-                uuid=c["uuid"],
-                email=c["email"],
-                inbound_id=c["inbound_id"],
-                page=idx // 5
-            ) for idx, c in enumerate(all_clients)]
-            pages = {}
-            for card_ in cards:
-                pages.setdefault(card_.page, []).append(card_)
-            total = len(pages)
-            new_page = min(page, total-1) if total else 0
-            await state.update_data(del_pages=pages, del_cur=new_page)
-            if total:
-                await show_delete_page(q.message, pages[new_page], new_page, total)
+            await q.answer(f"✅ Клиент {client['email']} удалён", show_alert=True)
+            if len(snap):
+                offset = clamp_offset(offset, len(snap))
+                await save_del_cursor(state, snap, offset)
+                await show_delete_page(q.message, snap, offset)
             else:
                 await state.clear()
-                try:
-                    online = len(await server_manager.get_online_clients(sid))
-                except Exception:
-                    online = 0
+                online = presence.online_count(sid)
                 menu_title = f"Меню администратора (сервер: {sid})"
                 await q.message.edit_text(menu_title, reply_markup=admin_menu_keyboard(sid, online))
         except Exception as e:
@@ -352,18 +396,16 @@ def register_admin_handlers(dp):
 def humanize_last_seen(ts):
     if not ts:
         return "никогда"
-    dt = datetime.fromtimestamp(ts)
-    delta = datetime.utcnow() - dt
-    mins = int(delta.total_seconds() // 60)
+    # ts — unix-время; оба конца в UTC, без смешения локального и utc-времени
+    mins = int((time.time() - ts) // 60)
     if mins < 1:
         return "только что"
-    elif mins == 1:
-        return "1 мин назад"
     elif mins < 60:
         return f"{mins} мин назад"
+    elif mins < 48 * 60:
+        return f"{mins // 60} ч назад"
     else:
-        hours = mins // 60
-        return f"{hours} ч назад"
+        return f"{mins // (24 * 60)} дн назад"
 
 async def on_startup():
     logger.info("✅ Bot started")
@@ -389,19 +431,94 @@ async def on_startup():
     start_scheduler(bot)
     await init_models() 
 
-def make_del_kb(cards: list, page: int, total: int):
-    rows = [[InlineKeyboardButton(text=c.email, callback_data=f"del_{c.uuid}")] for c in cards]
+LIST_PAGE = 10
+
+
+def client_line(sid: str, c: dict) -> str:
+    return (f"• <code>{c['email']}</code> · {sid} · "
+            f"⬆ {_to_gb(c.get('bytes_in', 0))} ⬇ {_to_gb(c.get('bytes_out', 0))} ГБ")
+
+
+def render_clients_page(snap, rows: list[dict]):
+    """Страница списка клиентов сервера; навигация — курсором по email (cl:…)."""
+    if not rows:
+        return "Нет клиентов.", InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
+    start = snap.position(rows[0]["email"])
+    text = (f"<b>Клиенты {snap.sid}</b> ({start + 1}–{start + len(rows)} из {len(snap)})\n"
+            + "\n".join(client_line(snap.sid, c) for c in rows))
+    nav = []
+    if start > 0:
+        nav.append(InlineKeyboardButton(text="⏪", callback_data=f"cl:{snap.sid}:p:{start}:{anchor_key(rows[0]['email'])}"))
+    if start + len(rows) < len(snap):
+        end = start + len(rows)
+        nav.append(InlineKeyboardButton(text="⏩", callback_data=f"cl:{snap.sid}:n:{end}:{anchor_key(rows[-1]['email'])}"))
+    return text, InlineKeyboardMarkup(inline_keyboard=[nav, [back_button()]] if nav else [[back_button()]])
+
+
+CALLBACK_LIMIT = 64  # байт в callback_data
+OFFSET_DIGITS = 6
+
+
+def fit_prefix(scope: str, prefix: str) -> str:
+    """Префикс, при котором fd:<scope>:<offset>:<префикс> укладывается в 64 байта (UTF-8)."""
+    room = CALLBACK_LIMIT - len(f"fd:{scope}::".encode()) - OFFSET_DIGITS
+    return prefix.encode()[:max(0, room)].decode("utf-8", "ignore")
+
+
+async def render_search_page(scope: str, prefix: str, offset: int):
+    """Результаты поиска по префиксу в снимках одного (scope=sid) или всех (*) серверов."""
+    snaps = await inventory.get_all() if scope == "*" else {scope: await inventory.get(scope)}
+    found = [(sid, c) for sid, snap in snaps.items() for c in snap.search(prefix)]
+    back = [back_button()]
+    if not found:
+        return f"Ничего не найдено по «{html.escape(prefix)}».", InlineKeyboardMarkup(inline_keyboard=[back])
+    rows = found[offset:offset + LIST_PAGE]
+    text = (f"<b>Поиск «{html.escape(prefix)}»</b> ({offset + 1}–{offset + len(rows)} из {len(found)})\n"
+            + "\n".join(client_line(sid, c) for sid, c in rows))
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(text="⏪", callback_data=f"fd:{scope}:{max(0, offset - LIST_PAGE)}:{prefix}"))
+    if offset + LIST_PAGE < len(found):
+        nav.append(InlineKeyboardButton(text="⏩", callback_data=f"fd:{scope}:{offset + LIST_PAGE}:{prefix}"))
+    return text, InlineKeyboardMarkup(inline_keyboard=[nav, back] if nav else [back])
+
+
+DEL_PAGE = 5
+
+
+def clamp_offset(offset: int, total: int) -> int:
+    """Смещение первой страницы, не выходящей за конец списка."""
+    last = max(0, (total - 1) // DEL_PAGE * DEL_PAGE)
+    return max(0, min(offset, last))
+
+
+async def save_del_cursor(state: FSMContext, snap, offset: int):
+    page = snap.page(offset, DEL_PAGE)
+    await state.update_data(del_ver=snap.version, del_off=offset, del_anchor=page[0]["email"] if page else None)
+
+
+def resolve_del_offset(data: dict, snap) -> int:
+    """Смещение страницы в текущем снимке: после обновления снимка — от первого email страницы."""
+    if data.get("del_ver") == snap.version or not data.get("del_anchor"):
+        return clamp_offset(data["del_off"], len(snap))
+    return clamp_offset(snap.position(data["del_anchor"]), len(snap))
+
+
+def make_del_kb(cards: list[dict], offset: int, total: int):
+    rows = [[InlineKeyboardButton(text=c["email"], callback_data=f"del_{c['uuid']}")] for c in cards]
+    pages = (total + DEL_PAGE - 1) // DEL_PAGE
+    page = offset // DEL_PAGE
     nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton(text="⏪", callback_data=f"prev_del:{page-1}"))
-    nav.append(InlineKeyboardButton(text=f"{page+1}/{total}", callback_data="noop"))
-    if page < total-1:
-        nav.append(InlineKeyboardButton(text="⏩", callback_data=f"next_del:{page+1}"))
+    if offset > 0:
+        nav.append(InlineKeyboardButton(text="⏪", callback_data=f"prev_del:{offset - DEL_PAGE}"))
+    nav.append(InlineKeyboardButton(text=f"{page+1}/{pages}", callback_data="noop"))
+    if offset + DEL_PAGE < total:
+        nav.append(InlineKeyboardButton(text="⏩", callback_data=f"next_del:{offset + DEL_PAGE}"))
     rows.append(nav)
     rows.append([back_button("admin_back")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-async def show_delete_page(msg, cards, page, total):
-    kb = make_del_kb(cards, page, total)
+async def show_delete_page(msg, snap, offset: int):
+    kb = make_del_kb(snap.page(offset, DEL_PAGE), offset, len(snap))
     text = "Выберите клиента для удаления:"
     await msg.edit_text(text, reply_markup=kb) 
\ No newline at end of file
@@ -1,17 +1,22 @@
 from aiogram import types, Router, F
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
-from aiogram.utils.chat_action import ChatActionSender
 from aiogram.types import BufferedInputFile
 import asyncio, io, textwrap
+from collections import OrderedDict
 from loguru import logger
-from aiolimiter import AsyncLimiter
 
 from config import is_admin, app_settings
-from db import SessionLocal, Broadcast, BroadcastErrorLog        # понадобится для статистики ошибок
+from db import SessionLocal, Broadcast
 from services import reminders
 from services.telegram_utils import safe_send
 from services.reminders import list_active_clients
+from services.send_queue import outbound, ADMIN
+from services.flood_control import flood
+from services.link_cache import links
+from services.membership import membership
+from services.progress import MessageRef
+from services import jobs
 
 router = Router()
 
@@ -46,72 +51,59 @@ async def cmd_send(msg: types.Message):
     except (TelegramBadRequest, TelegramForbiddenError) as e:
         await msg.answer(f"⚠️ Не удалось: {e.message}")
 
-# ---------- /bc ----------
-BATCH, PAUSE = 25, 1.2
-limiter = AsyncLimiter(29, 1)
-
-def get_progress_bar(current, total, length=10):
-    percent = current / total if total else 0
-    filled = int(percent * length)
-    bar = '▇' * filled + '▂' * (length - filled)
-    percent_str = f"{int(percent * 100)}%"
-    return f"{bar} {percent_str}"
+# ---------- альбомы админов ----------
+# Bot API не отдаёт соседние сообщения альбома, поэтому запоминаем их id сами
+ALBUMS_KEEP = 50
+_albums: OrderedDict[str, list[int]] = OrderedDict()
+
+@router.message.outer_middleware()
+async def record_albums(handler, event: types.Message, data):
+    if event.media_group_id and event.from_user and is_admin(event.from_user):
+        _albums.setdefault(event.media_group_id, []).append(event.message_id)
+        _albums.move_to_end(event.media_group_id)
+        while len(_albums) > ALBUMS_KEEP:
+            _albums.popitem(last=False)
+    return await handler(event, data)
+
+def copy_spec(msg: types.Message) -> dict:
+    """
+    Рассылка ответом на сообщение: copy_message без повторной загрузки файлов,
+    для альбома — один copy_messages со всеми его частями.
+    """
+    src = msg.reply_to_message
+    if src.media_group_id and len(_albums.get(src.media_group_id, [])) > 1:
+        return {"from_chat_id": src.chat.id, "message_ids": sorted(_albums[src.media_group_id])}
+    return {"from_chat_id": src.chat.id, "message_ids": [src.message_id]}
 
+# ---------- /bc ----------
 @router.message(Command("bc"))
 async def cmd_bc(msg: types.Message):
     if not is_admin(msg.from_user):
         return
 
-    parts = msg.text.split(maxsplit=1)
-    if len(parts) < 2:
-        return await msg.answer("Использование: <code>/bc текст</code>", parse_mode="HTML")
-    text = parts[1]
-
-    ids = await reminders.list_all_chat_ids()
-    if not ids:
-        return await msg.answer("В базе нет получателей")
-
-    total = len(ids); ok = err = 0
-    failed: list[tuple[int, str]] = []
-
-    progress = await msg.answer(f"🚀 Рассылка… 0 / {total}\n{get_progress_bar(0, total)}")
-
-    async with ChatActionSender.typing(msg.bot, msg.chat.id):
-        for i, cid in enumerate(ids, 1):
-            try:
-                async with limiter:
-                    await safe_send(msg.bot.send_message, cid, text)
-                ok += 1
-            except Exception as e:
-                err += 1
-                failed.append((cid, e.__class__.__name__))
-
-            if i % 5 == 0 or i == total:
-                bar = get_progress_bar(i, total)
-                async with limiter:
-                    await safe_send(progress.edit_text,
-                        f"🚀 Рассылка… {i} / {total}\n{bar}\n"
-                        f"✅ {ok}  ⚠️ {err}",
-                        silent=True)
-
-            if i % BATCH == 0:
-                await asyncio.sleep(PAUSE)
-
-    await safe_send(progress.edit_text,
-        f"🏁 Готово!\n✅ <b>{ok}</b>  ⚠️ <b>{err}</b>",
-        parse_mode="HTML", silent=True)
-
-    # лог ошибок в БД (если нужен)
-    if failed:
-        async with SessionLocal() as s:
-            s.add_all([BroadcastErrorLog(bc_id=None, chat_id=c, reason=r) for c, r in failed])
-            await s.commit()
-
-        # краткий список в чат
-        details = "\n".join(f"{cid} — {reason}" for cid, reason in failed)
-        if len(details) < app_settings.MAX_MSG_LEN - 100:
-            await msg.answer(f"<b>Не доставлено:</b>\n{details}", parse_mode="HTML")
-        else:
-            buf = io.BytesIO(details.encode()); buf.name = "failed.txt"
-            await msg.bot.send_document(msg.chat.id, BufferedInputFile(buf.read(), buf.name),
-                                         caption="Не доставлено") 
\ No newline at end of file
+    if msg.reply_to_message:
+        spec = copy_spec(msg)
+        text = f"[copy {spec['from_chat_id']}:{spec['message_ids']}]"
+    else:
+        parts = msg.text.split(maxsplit=1)
+        if len(parts) < 2:
+            return await msg.answer(
+                "Использование: <code>/bc текст</code> или ответьте <code>/bc</code> на сообщение для рассылки",
+                parse_mode="HTML")
+        text = parts[1]
+        spec = {"text": text}
+
+    async with SessionLocal() as s:
+        bc = Broadcast(text=text)
+        s.add(bc)
+        await s.commit()
+
+    progress = await safe_send(msg.answer, "🚀 Рассылка…", priority=ADMIN)
+    await jobs.submit(msg.bot, "broadcast", MessageRef.of(progress), bc.id, spec)
+
+# ---------- /sendq ----------
+@router.message(Command("sendq"))
+async def cmd_sendq(msg: types.Message):
+    if not is_admin(msg.from_user):
+        return
+    await safe_send(msg.answer, f"<pre>{outbound.stats_text()}\n{flood.stats_text()}\n{links.stats_text()}\n{membership.stats_text()}</pre>", parse_mode="HTML")
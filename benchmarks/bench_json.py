@@ -0,0 +1,84 @@
+"""
+Микробенчмарк JSON на горячих путях: разбор апдейта Telegram, сериализация
+запроса sendMessage с клавиатурой и разбор ответа панели inbounds/list
+(включая вложенную строку settings). Сравнивает стандартный json и services.codec.
+
+    python benchmarks/bench_json.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import codec
+
+
+def make_update(i: int) -> bytes:
+    user = {"id": 100000 + i, "is_bot": False, "first_name": "Иван", "username": f"user{i}", "language_code": "ru"}
+    return json.dumps({"ok": True, "result": [{
+        "update_id": 900000 + i,
+        "callback_query": {
+            "id": str(i), "from": user, "chat_instance": "-123", "data": "get_key",
+            "message": {
+                "message_id": i, "date": 1700000000, "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "chat": {"id": 100000 + i, "type": "private", "first_name": "Иван"},
+                "text": "Главное меню\n" + "текст " * 40,
+                "reply_markup": {"inline_keyboard": [[{"text": f"Кнопка {k}", "callback_data": f"cb_{k}"}] for k in range(6)]},
+            },
+        },
+    }]}).encode()
+
+
+def make_send(i: int) -> dict:
+    return {
+        "chat_id": 100000 + i,
+        "text": "🔑 Ваш ключ:\n<code>vless://" + "x" * 200 + "</code>",
+        "parse_mode": "HTML",
+        "reply_markup": {"inline_keyboard": [[{"text": f"Кнопка {k}", "callback_data": f"cb_{k}"}] for k in range(6)]},
+    }
+
+
+def make_inbounds(clients: int) -> bytes:
+    settings = json.dumps({"clients": [{"id": f"uuid-{c}", "email": f"{c}_user", "flow": "xtls-rprx-vision"} for c in range(clients)]})
+    stats = [{"id": c, "email": f"{c}_user", "up": c * 1000, "down": c * 5000, "enable": True} for c in range(clients)]
+    return json.dumps({"success": True, "obj": [{"id": 1, "settings": settings, "clientStats": stats}]}).encode()
+
+
+def bench(label, fn, payloads, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        for p in payloads:
+            fn(p)
+    per = (time.process_time() - start) / (rounds * len(payloads)) * 1e6
+    print(f"  {label:<8} {per:8.2f} µs")
+    return per
+
+
+def run():
+    updates = [make_update(i) for i in range(200)]
+    sends = [make_send(i) for i in range(200)]
+    inbounds = [make_inbounds(500)]
+
+    def parse_inbounds(loads):
+        def fn(raw):
+            for ib in loads(raw)["obj"]:
+                loads(ib["settings"])
+        return fn
+
+    cases = [
+        ("апдейт (loads)", json.loads, codec.loads, updates, 200),
+        ("sendMessage (dumps)", json.dumps, codec.dumps, sends, 200),
+        ("inbounds/list, 500 клиентов", parse_inbounds(json.loads), parse_inbounds(codec.loads), inbounds, 50),
+    ]
+    print(f"codec: {codec.BACKEND}")
+    for title, old, new, payloads, rounds in cases:
+        print(title)
+        before = bench("json", old, payloads, rounds)
+        after = bench("codec", new, payloads, rounds)
+        print(f"  ускорение ×{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    run()
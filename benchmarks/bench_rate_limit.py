@@ -0,0 +1,67 @@
+"""
+Микробенчмарк горячего пути RateLimitMiddleware: get + set на пользователя
+при N отслеживаемых пользователях. Сравнивает прежний TTLDict с полным
+cleanup() на каждое сообщение и ExpiringDict.
+
+    python benchmarks/bench_rate_limit.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.expiring import ExpiringDict
+
+
+class LegacyTTLDict:
+    """Прежняя реализация из rate_limit.py — для сравнения."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+
+    def set(self, key, value):
+        self._data[key] = (value, time.time() + self.ttl)
+
+    def get(self, key, default=None):
+        v = self._data.get(key)
+        if not v:
+            return default
+        value, expires = v
+        if time.time() > expires:
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def cleanup(self):
+        now = time.time()
+        for k in list(self._data.keys()):
+            if self._data[k][1] < now:
+                self._data.pop(k, None)
+
+
+def per_event_us(d, users: int, events: int, cleanup: bool) -> float:
+    for uid in range(users):
+        d.set(uid, time.time())
+    ids = [random.randrange(users) for _ in range(events)]
+    t = time.perf_counter()
+    for uid in ids:
+        if cleanup:
+            d.cleanup()
+        d.get(uid, 0)
+        d.set(uid, time.time())
+    return (time.perf_counter() - t) / events * 1e6
+
+
+def main():
+    print(f"{'users':>8} {'legacy, мкс':>14} {'expiring, мкс':>14}")
+    for users in (1_000, 10_000, 100_000):
+        legacy = per_event_us(LegacyTTLDict(10), users, max(20, 200_000 // users), cleanup=True)
+        new = per_event_us(ExpiringDict(10, maxsize=200_000), users, 200_000, cleanup=False)
+        print(f"{users:>8} {legacy:>14.2f} {new:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,11 +15,49 @@ class AppSettings(BaseSettings):
     ADMIN_IDS: set[str] = Field(default_factory=set, env="ADMIN_IDS")
     MAX_MSG_LEN: int = Field(default=4000, env="MAX_MSG_LEN")
     MAX_INBOUNDS: int = Field(default=15, env="MAX_INBOUNDS")
+    INBOUND_BALANCE: str = Field(default="count", env="INBOUND_BALANCE")  # count | traffic: выбор inbound для нового клиента
     HTTPX_MAX_CONNECTIONS: int = Field(default=20, env="HTTPX_MAX_CONNECTIONS")
     CACHE_TTL_INBOUNDS: int = Field(default=60, env="CACHE_TTL_INBOUNDS")
     CACHE_TTL_CLIENTS: int = Field(default=60, env="CACHE_TTL_CLIENTS")
+    CHANNEL_ID: int | None = Field(default=None, env="CHANNEL_ID")  # канал для обязательной подписки; пусто — без проверки
+    CHANNEL_URL: str = Field(default="https://t.me/+2UXi1T8ZKEsyNGMy", env="CHANNEL_URL")
+    MEMBERSHIP_TTL: int = Field(default=600, env="MEMBERSHIP_TTL")  # подписан — перепроверяем раз в 10 мин
+    MEMBERSHIP_NEGATIVE_TTL: int = Field(default=20, env="MEMBERSHIP_NEGATIVE_TTL")  # не подписан — ответ на частые «Проверить подписку»
+    USER_OP_LOCK_TTL: int = Field(default=60, env="USER_OP_LOCK_TTL")  # макс. длительность операции пользователя (лок в Redis)
+    INVENTORY_TTL: int = Field(default=60, env="INVENTORY_TTL")  # снимок клиентов сервера для админских списков и поиска
+    FLEET_TIMEOUT: float = Field(default=8, env="FLEET_TIMEOUT")  # секунд на ответ сервера в сводке /fleet
+    PRESENCE_INTERVAL: float = Field(default=30, env="PRESENCE_INTERVAL")  # опрос onlines, секунд
+    PRESENCE_PERSIST_EVERY: float = Field(default=300, env="PRESENCE_PERSIST_EVERY")  # сохранение last-seen в БД
+    LINK_CACHE_TTL: int = Field(default=6 * 3600, env="LINK_CACHE_TTL")  # готовая ссылка пользователя
+    MIGRATION_GRACE_HOURS: float = Field(default=6, env="MIGRATION_GRACE_HOURS")  # старый ключ живёт после переноса; не меньше LINK_CACHE_TTL
+    MIGRATION_CONCURRENCY: int = Field(default=4, env="MIGRATION_CONCURRENCY")  # одновременных переносов
+    MIGRATION_MAX_MOVES: int = Field(default=50, env="MIGRATION_MAX_MOVES")  # переносов в одном плане
     DATABASE_URL: str = Field(default="sqlite+aiosqlite:///./data.sqlite", env="DATABASE_URL")
     MAX_CLIENTS: int = Field(default=15, env="MAX_CLIENTS")
+    TG_RATE: float = Field(default=28, env="TG_RATE")            # общий бюджет Bot API, вызовов в секунду
+    REMINDER_WINDOW_MINUTES: int = Field(default=120, env="REMINDER_WINDOW_MINUTES")
+    REMINDER_MISFIRE_HOURS: int = Field(default=24, env="REMINDER_MISFIRE_HOURS")
+    USE_WORKERS: bool = Field(default=False, env="USE_WORKERS")  # тяжёлые задачи — в Celery-воркеры (нужен STORAGE_BACKEND=redis)
+    CELERY_BROKER_URL: str = Field(default="sqla+sqlite:///./celery-broker.sqlite", env="CELERY_BROKER_URL")  # или redis://localhost:6379/0
+    CELERY_RESULT_BACKEND: str = Field(default="db+sqlite:///./celery-results.sqlite", env="CELERY_RESULT_BACKEND")
+    STORAGE_BACKEND: str = Field(default="memory", env="STORAGE_BACKEND")  # memory | redis: FSM, rate limit, капча
+    REDIS_URL: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
+    BOT_MODE: str = Field(default="polling", env="BOT_MODE")  # polling (разработка) | webhook
+    WEBHOOK_URL: str | None = Field(default=None, env="WEBHOOK_URL")  # публичный https-адрес; обязателен для webhook
+    WEBHOOK_PATH: str = Field(default="/webhook", env="WEBHOOK_PATH")
+    WEBHOOK_SECRET: str | None = Field(default=None, env="WEBHOOK_SECRET")  # обязателен для webhook
+    WEBHOOK_HOST: str = Field(default="0.0.0.0", env="WEBHOOK_HOST")
+    WEBHOOK_PORT: int = Field(default=8080, env="WEBHOOK_PORT")
+    WEBHOOK_MAX_CONCURRENCY: int = Field(default=64, env="WEBHOOK_MAX_CONCURRENCY")
+    SHUTDOWN_GRACE: int = Field(default=30, env="SHUTDOWN_GRACE")  # секунд на завершение хендлеров и отправок
+    STARTUP_DEADLINE: float = Field(default=20, env="STARTUP_DEADLINE")  # секунд на прогрев панелей и синхронизацию
+    LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")
+    LOG_PATH: str = Field(default="bot.log", env="LOG_PATH")
+    LOG_JSON: bool = Field(default=False, env="LOG_JSON")  # файл — JSON-строки вместо текста
+    LOG_DEBUG_SAMPLE: int = Field(default=100, env="LOG_DEBUG_SAMPLE")  # 1 из N DEBUG-записей с одной строки кода
+    SHARD_WORKERS: int = Field(default=0, env="SHARD_WORKERS")  # >1 — апдейты обрабатывают N процессов (sharded.py)
+    SCHEDULER_DB_URL: str | None = Field(default=None, env="SCHEDULER_DB_URL")  # по умолчанию — DATABASE_URL без async-драйвера
+    BC_WORKERS: int = Field(default=16, env="BC_WORKERS")
 
     model_config = ConfigDict(extra='allow', json_encoders={set: list})
 
@@ -62,6 +100,22 @@ class ServerSettings(BaseSettings):
 
     model_config = {"extra": "allow"}
 
+    @field_validator("INBOUNDS")
+    @classmethod
+    def check_inbounds(cls, v: str) -> str:
+        """Список целых id через запятую, хотя бы один — иначе выдавать ключи некуда."""
+        ids = [i.strip() for i in v.split(",") if i.strip()]
+        if not ids:
+            raise ValueError("INBOUNDS пуст — укажите id inbound через запятую")
+        if not all(i.isdigit() for i in ids):
+            raise ValueError(f"INBOUNDS: ожидаются целые id через запятую, получено {v!r}")
+        return ",".join(ids)
+
+    @property
+    def inbound_ids(self) -> list[int]:
+        """Id из INBOUNDS по порядку, без повторов."""
+        return list(dict.fromkeys(int(i) for i in self.INBOUNDS.split(",") if i.strip()))
+
 def build_all_servers() -> dict[str, ServerSettings]:
     ids = [i.strip() for i in os.getenv("SERVERS", "").split(",") if i.strip()]
     if not ids:
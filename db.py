@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, BigInteger, Boolean, DateTime, func, String, Integer
+from sqlalchemy import Column, BigInteger, Boolean, DateTime, func, String, Integer, inspect, text
 from config import app_settings
 import aiosqlite
 
@@ -17,6 +17,9 @@ class ReminderSetting(Base):
     enabled     = Column(Boolean,  nullable=False, default=False)
     asked       = Column(Boolean,  nullable=False, default=False)
     last_msg_id = Column(BigInteger, nullable=True)
+    dead_reason = Column(String, nullable=True)   # blocked / deactivated / not_found, None — доставляемый
+    dead_at     = Column(DateTime(timezone=True), nullable=True)
+    reminded_at = Column(DateTime(timezone=True), nullable=True)  # последнее ежемесячное напоминание
     created_at  = Column(DateTime(timezone=True), server_default=func.now())
     updated_at  = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -39,9 +42,46 @@ class BroadcastErrorLog(Base):
     reason = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class ClientPresence(Base):
+    __tablename__ = "client_presence"
+    sid       = Column(String, primary_key=True)
+    email     = Column(String, primary_key=True)
+    last_seen = Column(BigInteger, nullable=False)  # unix-время последнего онлайна
+
+class MigrationMove(Base):
+    """Перенос клиента между серверами: planned -> created -> notified -> done (или skipped/failed)."""
+    __tablename__ = "migration_moves"
+    id           = Column(Integer, primary_key=True, autoincrement=True)
+    plan_id      = Column(String, nullable=False, index=True)
+    email        = Column(String, nullable=False)
+    tg_id        = Column(BigInteger, nullable=False)
+    src          = Column(String, nullable=False)
+    src_inbound  = Column(Integer, nullable=False)
+    client_id    = Column(String, nullable=False)  # id клиента на источнике (для delClient)
+    dst          = Column(String, nullable=False)
+    state        = Column(String, nullable=False, default="planned")
+    attempts     = Column(Integer, nullable=False, default=0)
+    error        = Column(String, nullable=True)
+    delete_after = Column(DateTime(timezone=True), nullable=True)
+    created_at   = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at   = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+def _add_missing_columns(conn):
+    """create_all не меняет существующие таблицы — добавляем новые nullable-колонки."""
+    insp = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in existing and col.nullable:
+                col_type = col.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+
 async def init_models():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
 
 async def get_selected(admin_id: int) -> str | None:
     async with SessionLocal() as s:
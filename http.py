@@ -1,7 +1,7 @@
 import httpx
 from datetime import datetime, timedelta
 from urllib.parse import quote
-import json
+from services.codec import dumps, dumps_bytes, response_json, JSON_HEADERS
 from httpx import HTTPStatusError
 from config import app_settings, SERVERS_CFG
 from aiocache import cached
@@ -32,7 +32,7 @@ async def api_auth(server_cfg, force=False) -> httpx.Cookies:
             timeout=10,
         )
     resp.raise_for_status()
-    data = resp.json()
+    data = response_json(resp)
     if not data.get("success"):
         raise RuntimeError("Авторизация не удалась")
     cookies = resp.cookies
@@ -48,7 +48,7 @@ async def api_inbounds_list(server_cfg, cookies: httpx.Cookies):
             "/panel/api/inbounds/list", cookies=cookies, timeout=10
         )
     resp.raise_for_status()
-    return resp.json().get("obj", [])
+    return response_json(resp).get("obj", [])
 
 @cached(ttl=app_settings.CACHE_TTL_CLIENTS)
 @backoff.on_exception(backoff.expo, (httpx.RequestError, httpx.HTTPStatusError), max_tries=3, jitter=backoff.full_jitter)
@@ -74,11 +74,12 @@ async def api_create_client(
         "reset": 0,
         "sid": "",
     }
-    payload = {"id": inbound_id, "settings": json.dumps({"clients": [cfg]})}
+    payload = {"id": inbound_id, "settings": dumps({"clients": [cfg]})}
     async with get_httpx_client(server_cfg) as client:
         resp = await client.post(
             "/panel/api/inbounds/addClient",
-            json=payload,
+            content=dumps_bytes(payload),
+            headers=JSON_HEADERS,
             cookies=cookies,
             timeout=10,
         )
@@ -115,7 +116,7 @@ async def api_traffic(server_cfg, cookies: httpx.Cookies, client: dict) -> dict:
                 cookies=cookies, timeout=10
             )
         resp.raise_for_status()
-        return resp.json().get("obj", {}) or {"uplink": 0, "downlink": 0, "total": 0}
+        return response_json(resp).get("obj", {}) or {"uplink": 0, "downlink": 0, "total": 0}
     except HTTPStatusError as e:
         if e.response.status_code != 404:
             raise
@@ -126,7 +127,7 @@ async def api_traffic(server_cfg, cookies: httpx.Cookies, client: dict) -> dict:
                 cookies=cookies, timeout=10
             )
         resp.raise_for_status()
-        return resp.json().get("obj", {}) or {"uplink": 0, "downlink": 0, "total": 0}
+        return response_json(resp).get("obj", {}) or {"uplink": 0, "downlink": 0, "total": 0}
     except HTTPStatusError:
         return {"uplink": 0, "downlink": 0, "total": 0}
 
@@ -137,4 +138,4 @@ async def api_onlines(server_cfg, cookies: httpx.Cookies) -> list:
             "/panel/api/inbounds/onlines", cookies=cookies, timeout=10
         )
         resp.raise_for_status()
-        return resp.json().get("obj", []) 
\ No newline at end of file
+        return response_json(resp).get("obj", []) 
\ No newline at end of file
@@ -49,6 +49,7 @@ def admin_menu_keyboard(sid: str, online: int = 0) -> InlineKeyboardMarkup:
         ],
         [
             InlineKeyboardButton(text="🔄 Синхронизация", callback_data="admin_sync_reminders"),
+            InlineKeyboardButton(text="🌍 Все серверы", callback_data="admin_fleet"),
         ],
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
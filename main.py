@@ -34,6 +34,7 @@ import random
 
 from config import app_settings, is_admin, SERVERS_CFG
 from services.core import pick_server_by_load, get_best_server_cfg, server_manager, ensure_user_profile
+from services.server_manager import place_inbound
 from keyboards import user_keyboard, admin_menu_keyboard
 from api.http import api_auth, api_clients, api_create_client, api_delete_client, api_inbounds_list, api_traffic, api_onlines, build_vless
 from handlers.user import register_user_handlers, find_user_server
@@ -43,8 +44,15 @@ from db import init_models
 from services import reminders
 from services.instructions import send_or_edit
 from sync_reminders import sync_reminders
-from middlewares.rate_limit import RateLimitMiddleware
-from services.telegram_utils import safe_send
+from middlewares.rate_limit import RateLimitMiddleware, CAPTCHA_TTL
+from services.telegram_utils import safe_send, bot_session
+from services import recipient_health
+from services import readiness
+from services.presence import presence
+from services.logs import setup_logging
+from services import storage
+from services.send_queue import outbound
+from webhook import run_webhook
 from handlers.admin import ensure_admin_sid
 
 # -------------------- 3. FSM -------------------- #
@@ -58,8 +66,8 @@ class AdminDelClient(StatesGroup):
     waiting_clientid = State()
 
 # -------------------- 5. Бот и хендлеры -------------------- #
-bot = Bot(token=app_settings.TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
+bot = Bot(token=app_settings.TELEGRAM_TOKEN, session=bot_session(), default=DefaultBotProperties(parse_mode="HTML"))
+dp = Dispatcher(storage=storage.build_fsm_storage())
 
 async def get_or_create_user_key(server_cfg, cookies, tg_id, desired_name):
     prefix = f"{tg_id}_"
@@ -68,81 +76,99 @@ async def get_or_create_user_key(server_cfg, cookies, tg_id, desired_name):
     if user_clients:
         return user_clients[0]["email"]
     email = prefix + desired_name
-    inbound_id = int(server_cfg.INBOUNDS.split(",")[0])
+    inbound_id = place_inbound(server_cfg, all_clients)
     await api_create_client(server_cfg, cookies, inbound_id, email, tg_id)
     return email
 
 async def validate_inbounds():
     for sid, server_cfg in SERVERS_CFG.items():
-        count = len(server_cfg.INBOUNDS)
-        if count > 15:
+        count = len(server_cfg.inbound_ids)
+        if count > app_settings.MAX_INBOUNDS:
             msg = (
-                f"⚠️ Внимание: в конфиге указано {count} INBOUNDS, "
-                "рекомендуемый максимум — 15."
+                f"⚠️ Внимание: у сервера {sid} в INBOUNDS {count} id, "
+                f"рекомендуемый максимум — {app_settings.MAX_INBOUNDS}; "
+                f"новые клиенты распределяются по первым {app_settings.MAX_INBOUNDS}."
             )
             logger.warning(msg)
-            for admin in app_settings.ADMIN_IDS:
-                if admin.isdigit():
-                    await safe_send(bot.send_message, int(admin), text=msg)
+            await asyncio.gather(*(
+                safe_send(bot.send_message, int(admin), text=msg, silent=True)
+                for admin in app_settings.ADMIN_IDS if admin.isdigit()
+            ))
 
 # -------------------- 6. Запуск -------------------- #
-async def on_startup():
-    logger.info("✅ Bot started")
-    any_success = False
-    for sid, server_cfg in SERVERS_CFG.items():
-        try:
-            await api_auth(server_cfg)
-            logger.info(f"Авторизация успешна на сервере {sid}")
-            any_success = True
-        except Exception as e:
-            logger.warning(f"Сервер {sid} недоступен: {e}")
-    if not any_success:
-        logger.error("❌ Ни один сервер не доступен для авторизации!")
-    # Запуск фонового обновления куки
-    asyncio.create_task(server_manager.refresh_auth_cookies_forever())
-    start_scheduler(bot)
-    await init_models()
+# В шардированном режиме фоновые задачи (планировщик, обновление куки)
+# запускает только один воркер — см. sharded.py
+RUN_BACKGROUND = True
+
+async def warm_server(sid: str, server_cfg):
+    """Авторизация в панели (оба кэша куки) и прогрев кэша клиентов."""
+    cookies = await api_auth(server_cfg)
+    alive, _ = await asyncio.gather(server_manager.is_alive(sid), api_clients(server_cfg, cookies))
+    if not alive:
+        raise RuntimeError("авторизация не удалась")
+
+async def sync_after(panels):
+    await asyncio.gather(*panels, return_exceptions=True)
     count = await sync_reminders()
     logger.info(f"Синхронизировано {count} пользователей с сервера в базу данных.")
 
-async def on_shutdown(_):
+async def on_startup():
+    logger.info("✅ Bot started")
+    # БД нужна всем хендлерам — её ждём; панели прогреваются в фоне
+    await init_models()
+    storage.start_shared()
+    await recipient_health.load()
+    await presence.load()
+    # Панели опрашивает один процесс, остальные получают онлайн событиями
+    presence.start(poll=RUN_BACKGROUND, persist=RUN_BACKGROUND)
+    panels = {f"панель {sid}": asyncio.ensure_future(warm_server(sid, cfg)) for sid, cfg in SERVERS_CFG.items()}
+    steps = dict(panels)
+    if RUN_BACKGROUND:
+        # Запуск фонового обновления куки
+        asyncio.create_task(server_manager.refresh_auth_cookies_forever())
+        start_scheduler(bot)
+        steps["синхронизация БД"] = sync_after(list(panels.values()))
+    readiness.start(steps, app_settings.STARTUP_DEADLINE)
+
+async def on_shutdown():
     logger.info("🛑 Bot stopped")
     from scheduler import scheduler
-    scheduler.shutdown(wait=False)
-
-def sensitive_filter(record):
-    msg = record["message"]
-    sensitive_patterns = [
-        "password", "token", "cookies", "Authorization",
-        r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\\.[a-zA-Z0-9-.]+",  # email
-    ]
-    for pat in sensitive_patterns:
-        if re.search(pat, msg, re.IGNORECASE):
-            return False
-    return True
-
-def mask_sensitive(record):
-    msg = record["message"]
-    msg = re.sub(r"(?i)(token|password|Authorization)[=: ]+([^\s,;]+)", r"\1=***", msg)
-    msg = re.sub(r"(?i)cookies[=: ]+([^\s,;]+)", "cookies=***", msg)
-    msg = re.sub(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\\.[a-zA-Z0-9-.]+", "***@***", msg)
-    record["message"] = msg
-    return record
-
-logger = logger.patch(mask_sensitive)
-
-async def main():
-    logger.add("bot.log", level="INFO", rotation="10 MB", retention="10 days", compression="zip",
-               filter=sensitive_filter,
-               backtrace=True, diagnose=False)
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await presence.stop(persist=RUN_BACKGROUND)
+    # Досылаем то, что уже стоит в исходящей очереди
+    await outbound.drain(app_settings.SHUTDOWN_GRACE)
+    await storage.close_redis()
+
+def setup_dispatcher():
+    """Хендлеры, middleware и жизненный цикл — общие для всех режимов запуска."""
     register_user_handlers(dp, bot)
     register_admin_handlers(dp)
     dp.startup.register(validate_inbounds)
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
-    await bot.delete_webhook(drop_pending_updates=True)
-    dp.message.middleware(RateLimitMiddleware())
-    await dp.start_polling(bot)
+    rate_limiter = RateLimitMiddleware(storage.build_rate_limit_backend(CAPTCHA_TTL))
+    dp.message.middleware(rate_limiter)
+    dp.callback_query.middleware(rate_limiter)
+    dp.message.outer_middleware(recipient_health.ReinstateMiddleware())
+    dp.callback_query.outer_middleware(recipient_health.ReinstateMiddleware())
+    dp.message.middleware(readiness.ReadinessMiddleware())
+    dp.callback_query.middleware(readiness.ReadinessMiddleware())
+
+async def main():
+    setup_logging()
+    if app_settings.USE_WORKERS:
+        storage.require_shared("USE_WORKERS")
+    setup_dispatcher()
+    if app_settings.SHARD_WORKERS > 1:
+        # Хендлеры в приёмнике нужны только для списка allowed_updates
+        from sharded import run_sharded
+        return await run_sharded(dp, bot, app_settings.SHARD_WORKERS)
+    if app_settings.BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     load_dotenv()
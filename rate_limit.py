@@ -1,52 +1,43 @@
-import time
 import random
-import asyncio
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from collections import defaultdict
+from services.storage import MemoryRateLimitBackend
 
-USER_RATE_LIMIT = 1  # seconds
-CAPTCHA_TTL = 60     # seconds
-
-class TTLDict:
-    def __init__(self, ttl):
-        self.ttl = ttl
-        self._data = {}
-
-    def set(self, key, value):
-        self._data[key] = (value, time.time() + self.ttl)
-
-    def get(self, key, default=None):
-        v = self._data.get(key)
-        if not v:
-            return default
-        value, expires = v
-        if time.time() > expires:
-            self._data.pop(key, None)
-            return default
-        return value
-
-    def cleanup(self):
-        now = time.time()
-        for k in list(self._data.keys()):
-            if self._data[k][1] < now:
-                self._data.pop(k, None)
+USER_RATE_LIMIT = 1        # seconds
+CALLBACK_RATE_LIMIT = 0.5  # seconds, для нажатий кнопок
+CAPTCHA_TTL = 60           # seconds
 
 class RateLimitMiddleware(BaseMiddleware):
-    def __init__(self):
+    """
+    Один экземпляр вешается и на сообщения, и на callback-запросы:
+    состояние капчи у них общее. Счётчики и капча живут в backend —
+    в памяти процесса или в Redis (services.storage.build_rate_limit_backend).
+    """
+    def __init__(self, backend=None):
         super().__init__()
-        self.last_time = TTLDict(USER_RATE_LIMIT * 10)
-        self.captcha = TTLDict(CAPTCHA_TTL)
+        self.backend = backend or MemoryRateLimitBackend(CAPTCHA_TTL)
+
+    async def __call__(self, handler, event, data):
+        if isinstance(event, CallbackQuery):
+            return await self._on_callback(handler, event, data)
+        return await self._on_message(handler, event, data)
+
+    async def _on_callback(self, handler, event: CallbackQuery, data):
+        user_id = event.from_user.id
+        if await self.backend.get_captcha(user_id) is not None:
+            await event.answer("Сначала решите капчу в чате.", show_alert=True)
+            return
+        if not await self.backend.hit("cb", user_id, CALLBACK_RATE_LIMIT):
+            await event.answer("⏳ Не так быстро!")
+            return
+        return await handler(event, data)
 
-    async def __call__(self, handler, event: Message, data):
+    async def _on_message(self, handler, event: Message, data):
         user_id = event.from_user.id
-        now = time.time()
         state: FSMContext = data.get("state")
-        self.last_time.cleanup()
-        self.captcha.cleanup()
         # Проверка капчи
-        captcha_answer = self.captcha.get(user_id)
+        captcha_answer = await self.backend.get_captcha(user_id)
         if captcha_answer is not None:
             # Ожидаем ответ на капчу
             try:
@@ -55,18 +46,16 @@ class RateLimitMiddleware(BaseMiddleware):
                 await event.answer("Пожалуйста, введите число — ответ на капчу!")
                 return
             if user_answer == captcha_answer:
-                self.captcha.set(user_id, None)  # сбросить капчу
+                await self.backend.clear_captcha(user_id)  # сбросить капчу
                 await event.answer("✅ Капча решена. Спасибо!")
             else:
                 await event.answer("❌ Неверно. Попробуйте ещё раз!")
                 return
-        last = self.last_time.get(user_id, 0)
-        if now - last < USER_RATE_LIMIT:
+        if not await self.backend.hit("msg", user_id, USER_RATE_LIMIT):
             # Сохраняем капчу
             a, b = random.randint(1, 9), random.randint(1, 9)
             answer = a + b
-            self.captcha.set(user_id, answer)
+            await self.backend.set_captcha(user_id, answer)
             await event.answer(f"Слишком много запросов! Решите капчу: {a} + {b} = ?")
             return  # Не передаём дальше
-        self.last_time.set(user_id, now)
-        await handler(event, data) 
\ No newline at end of file
+        return await handler(event, data)
@@ -1,30 +1,101 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
 from services import reminders
 from aiogram import Bot
 from config import app_settings
 from loguru import logger
 from services.telegram_utils import safe_send
-from aiogram.utils.chat_action import ChatActionSender
+from services.send_queue import BULK
+from services import recipient_health
+from services import migration
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import asyncio
+import zlib
 
-scheduler = AsyncIOScheduler(timezone="Europe/Amsterdam")
+TZ = ZoneInfo("Europe/Amsterdam")
+REMINDER_TEXT = "🔔 Привет! Пришло время поддержать наш сервер, чтобы он продолжал стабильно работать. Благодарим за вашу помощь! 🙏"
 
-def start_scheduler(bot: Bot):
-    async def _job():
-        chat_ids = await reminders.list_enabled_chat_ids()
-        async def send_reminder(cid):
-            try:
-                async with ChatActionSender.typing(bot, cid):
-                    await safe_send(bot.send_message, cid,
-                        "🔔 Привет! Пришло время поддержать наш сервер, чтобы он продолжал стабильно работать. Благодарим за вашу помощь! 🙏"
-                    )
-            except Exception as e:
-                logger.error("Ошибка при отправке напоминания в {}: {}", cid, e)
-        await asyncio.gather(*(send_reminder(cid) for cid in chat_ids))
+def _sync_db_url(url: str) -> str:
+    # APScheduler 3 работает с синхронным SQLAlchemy: sqlite — встроенный модуль,
+    # PostgreSQL — через psycopg2 (psycopg2-binary в requirements.txt)
+    return url.replace("+aiosqlite", "").replace("+asyncpg", "+psycopg2")
+
+scheduler = AsyncIOScheduler(
+    timezone=TZ,
+    jobstores={"default": SQLAlchemyJobStore(url=app_settings.SCHEDULER_DB_URL or _sync_db_url(app_settings.DATABASE_URL))},
+)
+_bot: Bot | None = None
+_campaign_lock = asyncio.Lock()
+
+def reminder_offset(chat_id: int, window: int) -> int:
+    """Фиксированный сдвиг получателя внутри окна, секунды: одинаков от месяца к месяцу."""
+    return zlib.crc32(str(chat_id).encode()) % window if window > 0 else 0
+
+async def send_monthly_reminders():
+    """
+    Кампания напоминаний: получатели распределяются по окну
+    REMINDER_WINDOW_MINUTES, а не отправляются все разом.
+    Повторный запуск (catch-up, рестарт посреди окна) пропускает тех,
+    кому уже напомнили.
+    """
+    async with _campaign_lock:
+        await _run_campaign()
 
+async def _run_campaign():
+    started = datetime.now(timezone.utc)
+    window = app_settings.REMINDER_WINDOW_MINUTES * 60
+    chat_ids = await reminders.list_due_chat_ids(started - timedelta(days=20))
+    plan = sorted((reminder_offset(cid, window), cid) for cid in chat_ids)
+    logger.info("Напоминания: {} получателей в окне {} мин", len(plan), app_settings.REMINDER_WINDOW_MINUTES)
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    failures = []
+
+    async def send_reminder(cid):
+        try:
+            await safe_send(_bot.send_message, cid, REMINDER_TEXT, priority=BULK)
+            await reminders.mark_reminded(cid, datetime.now(timezone.utc))
+        except Exception as e:
+            failures.append((cid, recipient_health.classify(e)))
+            logger.error("Ошибка при отправке напоминания в {}: {}", cid, e)
+
+    tasks = []
+    for offset, cid in plan:
+        delay = t0 + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_reminder(cid)))
+    await asyncio.gather(*tasks)
+    await recipient_health.mark_dead(failures)
+    logger.info("Напоминания отправлены: {} ok, {} ошибок", len(plan) - len(failures), len(failures))
+
+def start_scheduler(bot: Bot):
+    global _bot
+    _bot = bot
+    # На паузе: сохранённые задачи загружены, но не запускаются, пока не добавлены остальные
+    scheduler.start(paused=True)
     # Напоминание приходит всем пользователям с включенными уведомлениями
-    # каждое 10-е число месяца в 17:00 по Moscow time,
-    # независимо от даты получения конфига
-    scheduler.add_job(_job, "cron", day=10, hour=17, minute=0, id="support_monthly", max_instances=1)
-    #scheduler.add_job(_job, "interval", minutes=1, id="support_test_minutely", max_instances=1)
-    scheduler.start() 
\ No newline at end of file
+    # каждое 10-е число месяца с 17:00 по Amsterdam time в течение окна,
+    # независимо от даты получения конфига. Задача хранится в БД и добавляется
+    # только один раз: при повторном add_job APScheduler пересчитал бы next_run_time
+    # от текущего времени и пропущенный, пока бот был выключен, запуск потерялся бы.
+    # С сохранённым next_run_time он выполнится при старте (misfire grace).
+    trigger = CronTrigger(day=10, hour=17, minute=0, timezone=TZ)
+    job = scheduler.get_job("support_monthly")
+    if job is None:
+        scheduler.add_job(
+            send_monthly_reminders, trigger,
+            id="support_monthly", max_instances=1,
+            coalesce=True, misfire_grace_time=app_settings.REMINDER_MISFIRE_HOURS * 3600,
+        )
+    elif str(job.trigger) != str(trigger):
+        scheduler.reschedule_job("support_monthly", trigger=trigger)
+    # Удаление перенесённых клиентов со старых серверов после grace
+    scheduler.add_job(
+        migration.finish_due, "interval", minutes=15,
+        id="migration_finish", max_instances=1, replace_existing=True, coalesce=True,
+    )
+    #scheduler.add_job(send_monthly_reminders, "interval", minutes=1, id="support_test_minutely", max_instances=1)
+    scheduler.resume()
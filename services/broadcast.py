@@ -0,0 +1,140 @@
+import asyncio
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import BufferedInputFile
+from loguru import logger
+
+from config import app_settings
+from db import SessionLocal, BroadcastErrorLog
+from services import reminders
+from services.throttle import ChatPacer
+from services.flood_control import flood
+from services import recipient_health
+from services.send_queue import outbound, BULK
+from services.telegram_utils import safe_send
+from services.progress import ProgressReporter, MessageRef, format_duration
+
+MAX_RETRIES = 3
+
+pacer = ChatPacer()
+
+
+@dataclass
+class DeliveryStats:
+    total: int = 0
+    ok: int = 0
+    err: int = 0
+    retry_after: int = 0
+    failed: list[tuple[int, str]] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.err
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Фактическая скорость доставки, сообщений в секунду."""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+
+async def deliver(
+    recipients: Iterable[int],
+    send: Callable[[int], Awaitable],
+    stats: DeliveryStats | None = None,
+    workers: int | None = None,
+) -> DeliveryStats:
+    """
+    Доставляет сообщение всем получателям пулом воркеров.
+    send(chat_id) выполняет один вызов Bot API через outbound-очередь
+    (общий бюджет скорости); RetryAfter ставит на паузу всю очередь,
+    после чего получатель повторяется.
+    """
+    stats = stats or DeliveryStats()
+    workers = workers or app_settings.BC_WORKERS
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def producer():
+        for cid in recipients:
+            await queue.put(cid)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def worker():
+        while (cid := await queue.get()) is not None:
+            for attempt in range(1, MAX_RETRIES + 1):
+                await pacer.wait(cid)
+                try:
+                    await send(cid)
+                    stats.ok += 1
+                    break
+                except TelegramRetryAfter as e:
+                    stats.retry_after += 1
+                    flood.trip(e.retry_after)
+                    if attempt == MAX_RETRIES:
+                        stats.err += 1
+                        stats.failed.append((cid, e.__class__.__name__))
+                except Exception as e:
+                    kind = recipient_health.classify(e)
+                    stats.err += 1
+                    stats.failed.append((cid, kind if kind in recipient_health.PERMANENT else e.__class__.__name__))
+                    break
+
+    await asyncio.gather(producer(), *(worker() for _ in range(workers)))
+    await recipient_health.mark_dead(stats.failed)
+    return stats
+
+
+def make_sender(bot, spec: dict) -> Callable[[int], Awaitable]:
+    """
+    spec — сериализуемое описание рассылки (его же получает воркер):
+    {"text": ...} или {"from_chat_id": ..., "message_ids": [...]} для copy-режима.
+    """
+    if "message_ids" in spec:
+        src, ids = spec["from_chat_id"], spec["message_ids"]
+        if len(ids) > 1:
+            return lambda cid: outbound.submit(bot.copy_messages, cid, src, ids, priority=BULK)
+        return lambda cid: outbound.submit(bot.copy_message, cid, src, ids[0], priority=BULK)
+    return lambda cid: outbound.submit(bot.send_message, cid, spec["text"], priority=BULK)
+
+
+async def run_broadcast(bot, progress: MessageRef, bc_id: int, spec: dict):
+    ids = await reminders.list_all_chat_ids()
+    if not ids:
+        return await safe_send(progress.edit_text, "В базе нет получателей", silent=True)
+
+    stats = DeliveryStats(total=len(ids))
+    async with ProgressReporter(progress, stats.total, "🚀 Рассылка…",
+                                done=lambda: stats.done,
+                                details=lambda: f"✅ {stats.ok}  ⚠️ {stats.err}") as reporter:
+        await deliver(ids, make_sender(bot, spec), stats)
+        await reporter.finish(
+            f"🏁 Готово за {format_duration(stats.elapsed)} ({stats.throughput:.1f} msg/s)\n"
+            f"✅ <b>{stats.ok}</b>  ⚠️ <b>{stats.err}</b>",
+            parse_mode="HTML")
+    logger.info("Рассылка #{}: {} ok, {} err, {} RetryAfter, {:.1f} msg/s",
+                bc_id, stats.ok, stats.err, stats.retry_after, stats.throughput)
+
+    # лог ошибок в БД
+    failed = stats.failed
+    if failed:
+        async with SessionLocal() as s:
+            s.add_all([BroadcastErrorLog(bc_id=bc_id, chat_id=c, reason=r) for c, r in failed])
+            await s.commit()
+
+        # краткий список в чат
+        details = "\n".join(f"{cid} — {reason}" for cid, reason in failed)
+        if len(details) < app_settings.MAX_MSG_LEN - 100:
+            await safe_send(bot.send_message, progress.chat_id, f"<b>Не доставлено:</b>\n{details}", parse_mode="HTML")
+        else:
+            buf = io.BytesIO(details.encode()); buf.name = "failed.txt"
+            await safe_send(bot.send_document, progress.chat_id, BufferedInputFile(buf.read(), buf.name),
+                            caption="Не доставлено")
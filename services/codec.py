@@ -0,0 +1,33 @@
+"""
+Единый JSON-кодек: orjson, если установлен, иначе стандартный json.
+Используется клиентом панели, сессией Bot API и логированием.
+"""
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(obj, default=None) -> str:
+        return orjson.dumps(obj, default=default).decode()
+
+    dumps_bytes = orjson.dumps
+    BACKEND = "orjson"
+except ImportError:  # pragma: no cover
+    import json
+
+    loads = json.loads
+
+    def dumps(obj, default=None) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+    def dumps_bytes(obj) -> bytes:
+        return dumps(obj).encode()
+
+    BACKEND = "json"
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def response_json(resp):
+    """Тело httpx-ответа как JSON (замена resp.json())."""
+    return loads(resp.content)
@@ -4,6 +4,7 @@ import httpx
 import random
 from loguru import logger
 from services.server_manager import ServerManager
+from services.link_cache import links, tg_id_of
 
 server_manager = ServerManager(SERVERS_CFG)
 
@@ -48,25 +49,25 @@ async def get_or_create_user_key(tg_id, desired_name):
     if user_clients:
         return server_manager.cfgs[sid], user_clients[0]["email"]
     email = email_prefix + desired_name
-    inbound_id = int(server_manager.cfgs[sid].INBOUNDS.split(",")[0])
+    inbound_id = await server_manager.pick_inbound(sid)
     await server_manager.create_client(sid, inbound_id, email, tg_id)
     return server_manager.cfgs[sid], email
 
 async def delete_user_profile(tg_id):
-    sid = await server_manager.pick_least_loaded()
+    """Удаляет клиентов пользователя со всех серверов (после переноса их может быть два)."""
     email_prefix = f"{tg_id}_"
-    clients = await server_manager.list_clients(sid)
-    user_clients = [c for c in clients if c["email"].startswith(email_prefix)]
-    inbound_id = int(server_manager.cfgs[sid].INBOUNDS.split(",")[0])
-    for c in user_clients:
-        await server_manager.delete_client(sid, inbound_id, c["email"])
-    return len(user_clients)
+    links.invalidate(tg_id)
+    deleted = 0
+    for sid in server_manager.cfgs:
+        clients = await server_manager.list_clients(sid)
+        for c in clients:
+            if c["email"].startswith(email_prefix):
+                await server_manager.delete_client(sid, c["inbound_id"], c.get("uuid") or c["email"])
+                deleted += 1
+    return deleted
 
 async def get_user_traffic(tg_id):
-    sid = await server_manager.pick_least_loaded()
-    email_prefix = f"{tg_id}_"
-    clients = await server_manager.list_clients(sid)
-    user = next((c for c in clients if c["email"].startswith(email_prefix)), None)
+    sid, user = await find_user(f"{tg_id}_")
     if not user:
         return None
     return await server_manager.get_traffic(sid, user)
@@ -78,27 +79,42 @@ async def validate_inbounds():
 async def ensure_user_profile(tg_id: int, desired_name: str):
     """
     1) Ищет клиента на всех серверах.
-    2) Если найден – возвращает cfg, email.
+    2) Если найден – возвращает sid, email.
     3) Если не найден – создаёт профиль с учётом лимита.
     """
     email_prefix = f"{tg_id}_"
-    cfg, user = await find_user_server(email_prefix)
+    sid, user = await find_user(email_prefix)
     if user:
-        return cfg, user["email"]
+        return sid, user["email"]
     sid = await server_manager.pick_least_loaded()
     if await server_manager.is_full(sid):
         raise RuntimeError("Все серверы заполнены")
     email = email_prefix + desired_name
-    inbound_id = int(server_manager.cfgs[sid].INBOUNDS.split(",")[0])
+    inbound_id = await server_manager.pick_inbound(sid)
     await server_manager.create_client(sid, inbound_id, email, tg_id)
-    return server_manager.cfgs[sid], email
+    return sid, email
 
-async def find_user_server(user_id_prefix, prefer_domain=None):
-    for sid, cfg in server_manager.cfgs.items():
+async def find_user(user_id_prefix):
+    """
+    (sid, клиент) первого сервера, где есть клиент с таким префиксом email.
+    Во время переноса клиент есть и на старом сервере — отдаём новый.
+    """
+    from services.migration import in_flight
+    order = list(server_manager.cfgs)
+    tg_id = tg_id_of(user_id_prefix)
+    move = await in_flight(tg_id) if tg_id is not None else None
+    if move is not None and move[1] in server_manager.cfgs:
+        src, dst = move
+        order = [dst] + [sid for sid in order if sid not in (src, dst)]
+    for sid in order:
         clients = await server_manager.list_clients(sid)
         user = next((c for c in clients if c["email"].startswith(user_id_prefix)), None)
         if user:
-            return cfg, user
+            return sid, user
     return None, None
 
+async def find_user_server(user_id_prefix, prefer_domain=None):
+    sid, user = await find_user(user_id_prefix)
+    return (server_manager.cfgs[sid], user) if user else (None, None)
+
 # ... другие функции бизнес-логики ... 
\ No newline at end of file
@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+
+class ExpiringDict:
+    """
+    Словарь с единым TTL и ограничением размера.
+    TTL одинаков для всех ключей, поэтому порядок вставки (set переносит ключ
+    в конец) совпадает с порядком истечения: просроченные записи лениво
+    снимаются с головы при записи, амортизированно O(1) на операцию —
+    без полного обхода, как в прежнем TTLDict.cleanup().
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 100_000, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()
+
+    def _evict(self, now: float):
+        data = self._data
+        while data:
+            _, expires = data[next(iter(data))]
+            if expires > now:
+                break
+            data.popitem(last=False)
+
+    def set(self, key, value):
+        now = self._clock()
+        self._evict(now)
+        data = self._data
+        data[key] = (value, now + self.ttl)
+        data.move_to_end(key)
+        if len(data) > self.maxsize:
+            data.popitem(last=False)
+
+    def get(self, key, default=None):
+        v = self._data.get(key)
+        if v is None:
+            return default
+        value, expires = v
+        if expires <= self._clock():
+            del self._data[key]
+            return default
+        return value
+
+    def pop(self, key, default=None):
+        v = self._data.pop(key, None)
+        return default if v is None else v[0]
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
@@ -0,0 +1,84 @@
+"""
+Сводка по всем серверам: клиенты, онлайн, трафик, заполненность.
+Серверы опрашиваются параллельно с таймаутом на каждый; секция сервера
+вписывается в сообщение, как только он ответил, медленные и упавшие помечаются.
+"""
+import asyncio
+import html
+import time
+
+from aiogram.types import InlineKeyboardMarkup
+
+from config import app_settings
+from keyboards import back_button
+from services.core import server_manager
+from services.inventory import inventory
+from services.presence import presence
+from services.send_queue import ADMIN
+from services.telegram_utils import safe_send
+
+EDIT_INTERVAL = 1.0  # не чаще раза в секунду, последняя правка — всегда
+
+
+async def _online(sid: str):
+    # Свежий опрос трекера, иначе (трекер в другом процессе молчит или ещё не опрашивал) — панель
+    age = presence.age(sid)
+    if age is not None and age <= 2 * presence.interval:
+        return presence.online(sid)
+    return await server_manager.get_online_clients(sid)
+
+
+async def _server_section(sid: str) -> tuple[str, dict]:
+    snap, online = await asyncio.gather(inventory.get(sid), _online(sid))
+    online = online or []  # панель отдаёт null, когда онлайн никого нет
+    up = sum(c.get("bytes_in", 0) for c in snap.clients)
+    down = sum(c.get("bytes_out", 0) for c in snap.clients)
+    fill = len(snap) / app_settings.MAX_CLIENTS * 100 if app_settings.MAX_CLIENTS else 0
+    text = (f"🟢 <b>{sid}</b>: {len(snap)}/{app_settings.MAX_CLIENTS} ({fill:.0f}%), онлайн {len(online)}, "
+            f"⬆ {server_manager.to_gb(up):.1f} ⬇ {server_manager.to_gb(down):.1f} ГБ")
+    return text, {"clients": len(snap), "online": len(online), "up": up, "down": down}
+
+
+async def run_fleet_view(progress, timeout: float | None = None):
+    """Правит сообщение progress (MessageRef или Message) по мере ответов серверов."""
+    timeout = timeout or app_settings.FLEET_TIMEOUT
+    sids = list(server_manager.cfgs)
+    sections = {sid: f"⏳ <b>{sid}</b>: ждём ответа…" for sid in sids}
+    totals: dict[str, dict] = {}
+    started = time.monotonic()
+    kb = InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
+
+    def render(final: bool) -> str:
+        agg = {k: sum(t[k] for t in totals.values()) for k in ("clients", "online", "up", "down")}
+        # Ёмкость — всех настроенных серверов, не только ответивших
+        capacity = app_settings.MAX_CLIENTS * len(sids)
+        head = (f"<b>Все серверы</b> ({len(totals)}/{len(sids)} ответили"
+                f"{'' if final else ', опрос…'}, {time.monotonic() - started:.1f} с)\n"
+                f"Σ клиентов {agg['clients']} (ответившие), мест {capacity}, онлайн {agg['online']}, "
+                f"⬆ {server_manager.to_gb(agg['up']):.1f} ⬇ {server_manager.to_gb(agg['down']):.1f} ГБ\n")
+        return head + "\n".join(sections[sid] for sid in sids)
+
+    async def probe(sid: str):
+        try:
+            text, stats = await asyncio.wait_for(_server_section(sid), timeout)
+            totals[sid] = stats
+            sections[sid] = text
+        except asyncio.TimeoutError:
+            sections[sid] = f"🟡 <b>{sid}</b>: нет ответа за {timeout:.0f} с"
+        except Exception as e:
+            sections[sid] = f"🔴 <b>{sid}</b>: {html.escape(str(e))[:100]}"
+
+    last_edit = 0.0
+    dirty = False  # есть ответы, ещё не попавшие в сообщение
+    pending = {asyncio.create_task(probe(sid)) for sid in sids}
+    while pending:
+        # Пока есть невыведенные ответы, ждём не дольше, чем до следующей разрешённой правки
+        timeout = max(0.0, last_edit + EDIT_INTERVAL - time.monotonic()) if dirty else None
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        dirty = dirty or bool(done)
+        if pending and dirty and time.monotonic() - last_edit >= EDIT_INTERVAL:
+            last_edit = time.monotonic()
+            dirty = False
+            await safe_send(progress.edit_text, render(False), parse_mode="HTML", reply_markup=kb,
+                            silent=True, priority=ADMIN)
+    await safe_send(progress.edit_text, render(True), parse_mode="HTML", reply_markup=kb, silent=True, priority=ADMIN)
@@ -0,0 +1,47 @@
+import time
+
+from loguru import logger
+
+from services.send_queue import outbound
+from services.throttle import TokenBucket
+
+
+class FloodControl:
+    """
+    Общее состояние flood-wait для всех отправителей.
+    RetryAfter из любого места ставит на паузу общий bucket исходящей очереди,
+    поэтому остальные вызовы ждут в очереди, а не собирают новые 429.
+    """
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.events = 0
+        self.throttled_seconds = 0.0
+        self.max_retry_after = 0.0
+
+    def trip(self, retry_after: float):
+        now = time.monotonic()
+        until = now + retry_after
+        # RetryAfter от запросов, ушедших до паузы, — то же событие, а не новое
+        new = now >= self.bucket.paused_until
+        # Учитываем только ту часть окна, на которую пауза реально продлилась
+        self.throttled_seconds += max(0.0, until - max(now, self.bucket.paused_until))
+        self.max_retry_after = max(self.max_retry_after, retry_after)
+        self.bucket.on_retry_after(retry_after)
+        outbound.pause_shared(retry_after)
+        if new:
+            self.events += 1
+            logger.warning("Flood-wait {} с: все отправки приостановлены (событий: {})", retry_after, self.events)
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() < self.bucket.paused_until
+
+    def stats_text(self) -> str:
+        return (
+            f"Flood-wait: {self.events} раз, всего {self.throttled_seconds:.0f} с, "
+            f"макс. {self.max_retry_after:.0f} с"
+        )
+
+
+flood = FloodControl(outbound.bucket)
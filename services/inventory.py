@@ -0,0 +1,179 @@
+"""
+Снимки клиентов серверов (inventory) и префиксный индекс по ним.
+Снимок — отсортированный по email список клиентов одного сервера с версией;
+обновляется не чаще раза в INVENTORY_TTL секунд (одновременные запросы одного
+сервера сливаются в один list_clients), локальные изменения (удаление, создание)
+патчат снимок без повторной загрузки.
+"""
+import asyncio
+import hashlib
+import itertools
+import time
+from bisect import bisect_left, bisect_right
+
+from loguru import logger
+
+from config import app_settings
+from services.core import server_manager
+
+_versions = itertools.count(1)
+
+
+def anchor_key(email: str) -> str:
+    """Короткий ключ клиента для callback_data (лимит 64 байта), разрешается через Snapshot.resolve."""
+    return hashlib.blake2b(email.encode(), digest_size=6).hexdigest()
+
+
+class PrefixIndex:
+    """Отсортированный массив (ключ, email): поиск по префиксу — bisect + проход по совпадениям."""
+
+    def __init__(self, clients: list[dict]):
+        pairs = []
+        for c in clients:
+            email = c["email"]
+            pairs.append((email.lower(), email))
+            tg_id, sep, name = email.partition("_")
+            if sep and tg_id.isdigit():
+                pairs.append((name.lower(), email))
+            if c.get("uuid"):
+                pairs.append((c["uuid"].lower(), email))
+        pairs.sort()
+        self._keys = [k for k, _ in pairs]
+        self._emails = [e for _, e in pairs]
+
+    def search(self, prefix: str, limit: int | None = None) -> list[str]:
+        """Email'ы клиентов, у которых email, имя после tg_id или uuid начинается с prefix."""
+        prefix = prefix.lower()
+        seen, out = set(), []
+        for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if not self._keys[i].startswith(prefix):
+                break
+            email = self._emails[i]
+            if email not in seen:
+                seen.add(email)
+                out.append(email)
+                if limit and len(out) >= limit:
+                    break
+        return sorted(out)
+
+
+class Snapshot:
+    def __init__(self, sid: str, clients: list[dict]):
+        self.sid = sid
+        self.version = next(_versions)
+        self.fetched_at = time.monotonic()
+        self.clients = sorted(clients, key=lambda c: c["email"])
+        self._emails = [c["email"] for c in self.clients]
+        self._index: PrefixIndex | None = None
+        self._anchors: dict[str, str] | None = None
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    @property
+    def index(self) -> PrefixIndex:
+        if self._index is None:
+            self._index = PrefixIndex(self.clients)
+        return self._index
+
+    def resolve(self, key: str) -> str | None:
+        """Email по anchor_key; None — клиента в снимке нет."""
+        if self._anchors is None:
+            self._anchors = {anchor_key(e): e for e in self._emails}
+        return self._anchors.get(key)
+
+    def position(self, email: str) -> int:
+        return bisect_left(self._emails, email)
+
+    def get(self, email: str) -> dict | None:
+        i = self.position(email)
+        if i < len(self._emails) and self._emails[i] == email:
+            return self.clients[i]
+        return None
+
+    def page(self, offset: int, size: int) -> list[dict]:
+        return self.clients[offset:offset + size]
+
+    def after(self, email: str, size: int) -> list[dict]:
+        """Страница после email (курсор устойчив к удалениям и добавлениям)."""
+        i = bisect_right(self._emails, email)
+        return self.clients[i:i + size]
+
+    def before(self, email: str, size: int) -> list[dict]:
+        i = bisect_left(self._emails, email)
+        return self.clients[max(0, i - size):i]
+
+    def search(self, prefix: str, limit: int | None = None) -> list[dict]:
+        return [self.get(e) for e in self.index.search(prefix, limit)]
+
+    # Локальные правки после успешного вызова панели
+    def remove(self, email: str) -> bool:
+        i = self.position(email)
+        if i < len(self._emails) and self._emails[i] == email:
+            del self._emails[i], self.clients[i]
+            self._index = self._anchors = None
+            return True
+        return False
+
+    def add(self, client: dict):
+        i = bisect_left(self._emails, client["email"])
+        self._emails.insert(i, client["email"])
+        self.clients.insert(i, client)
+        self._index = self._anchors = None
+
+
+class Inventory:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshots: dict[str, Snapshot] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def peek(self, sid: str) -> Snapshot | None:
+        return self._snapshots.get(sid)
+
+    async def get(self, sid: str, max_age: float | None = None) -> Snapshot:
+        max_age = self.ttl if max_age is None else max_age
+        snap = self._snapshots.get(sid)
+        if snap is not None and snap.age <= max_age:
+            return snap
+        lock = self._locks.setdefault(sid, asyncio.Lock())
+        async with lock:
+            snap = self._snapshots.get(sid)
+            if snap is not None and snap.age <= max_age:
+                return snap  # пока ждали, снимок обновил другой запрос
+            snap = Snapshot(sid, await server_manager.list_clients(sid))
+            self._snapshots[sid] = snap
+            logger.debug("Inventory {}: {} клиентов, v{}", sid, len(snap), snap.version)
+            return snap
+
+    async def get_all(self, max_age: float | None = None) -> dict[str, Snapshot]:
+        """Снимки всех серверов; недоступные пропускаются."""
+        sids = list(server_manager.cfgs)
+        results = await asyncio.gather(*(self.get(sid, max_age) for sid in sids), return_exceptions=True)
+        snaps = {}
+        for sid, res in zip(sids, results):
+            if isinstance(res, Exception):
+                logger.warning("Inventory {}: {}", sid, res)
+            else:
+                snaps[sid] = res
+        return snaps
+
+    def invalidate(self, sid: str):
+        self._snapshots.pop(sid, None)
+
+    def remove(self, sid: str, email: str):
+        snap = self._snapshots.get(sid)
+        if snap is not None:
+            snap.remove(email)
+
+    def add(self, sid: str, client: dict):
+        snap = self._snapshots.get(sid)
+        if snap is not None:
+            snap.add(client)
+
+
+inventory = Inventory(app_settings.INVENTORY_TTL)
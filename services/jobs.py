@@ -0,0 +1,198 @@
+"""
+Тяжёлые админские операции. Каждая задача — корутина (bot, progress, *args),
+где progress — сообщение админа для прогресса. Аргументы сериализуемы,
+поэтому задачу можно выполнить в процессе бота или отдать Celery-воркеру.
+"""
+import asyncio
+import csv
+import heapq
+import html
+import os
+import tempfile
+from datetime import datetime
+
+from aiogram.types import InlineKeyboardMarkup, BufferedInputFile, FSInputFile
+from loguru import logger
+
+from config import app_settings, SERVERS_CFG
+from api.http import build_vless
+from keyboards import back_button
+from sync_reminders import sync_reminders
+from services.core import server_manager
+from services.server_manager import place_inbound
+from services.inventory import inventory
+from services.link_cache import tg_id_of
+from services.broadcast import run_broadcast
+from services.migration import run_migration
+from services.progress import ProgressReporter, MessageRef
+from services.telegram_utils import safe_send
+from services.send_queue import ADMIN
+
+_background: set[asyncio.Task] = set()
+
+
+async def run_sync_reminders(bot, progress: MessageRef):
+    total = 0
+    async with ProgressReporter(progress, len(SERVERS_CFG), "⏳ Синхронизация…",
+                                details=lambda: f"Новых: {total}") as reporter:
+        for s in SERVERS_CFG:
+            try:
+                count = await sync_reminders(SERVERS_CFG[s])
+                total += count
+            except Exception as e:
+                logger.warning(f"Ошибка синхронизации {s}: {e}")
+            reporter.advance()
+        await reporter.finish(f"Синхронизировано {total} новых пользователей.",
+                              reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+
+
+TOP_N = 10
+CSV_HEADER = ["server", "inbound_id", "email", "tg_id", "uuid", "enable", "up_bytes", "down_bytes", "total_bytes", "total_gb"]
+
+
+def _gb(n: int) -> str:
+    return f"{server_manager.to_gb(n):.2f}"
+
+
+def _join_lines(lines: list[str], limit: int) -> str:
+    """Целые строки до limit символов: обрезка посреди строки может разорвать HTML-тег."""
+    out, size = [], 0
+    for line in lines:
+        if size + len(line) + 1 > limit - 2:
+            out.append("…")
+            break
+        out.append(line)
+        size += len(line) + 1
+    return "\n".join(out)
+
+
+async def run_traffic_report(bot, progress: MessageRef, sid: str):
+    """
+    Отчёт по трафику сервера sid (или всех при sid="*") из снимков inventory:
+    строки пишутся в CSV на диске по одной, в чат — только сводка, топ-N и итоги по inbound.
+    """
+    kb = InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
+    try:
+        # Свежие данные: по одному list_clients на сервер, bytes_in/bytes_out уже в нём
+        snaps = await inventory.get_all(max_age=0) if sid == "*" else {sid: await inventory.get(sid, max_age=0)}
+    except Exception as e:
+        return await safe_send(progress.edit_text, f"Ошибка получения списка клиентов: {e}", reply_markup=kb, priority=ADMIN)
+    if not any(len(s) for s in snaps.values()):
+        return await safe_send(progress.edit_text, "❗ Клиентов нет.", reply_markup=kb, priority=ADMIN)
+
+    def rows():
+        for s, snap in snaps.items():
+            for c in snap.clients:
+                yield s, c
+
+    total_up = total_dn = count = 0
+    inbounds: dict[tuple[str, int], list[int]] = {}
+    f = tempfile.NamedTemporaryFile("w", newline="", encoding="utf-8-sig", suffix=".csv", delete=False)
+    path = f.name
+    try:
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for s, c in rows():
+                up, dn = c.get("bytes_in", 0), c.get("bytes_out", 0)
+                total_up += up; total_dn += dn; count += 1
+                sub = inbounds.setdefault((s, c.get("inbound_id")), [0, 0, 0])
+                sub[0] += 1; sub[1] += up; sub[2] += dn
+                writer.writerow([s, c.get("inbound_id"), c["email"], tg_id_of(c["email"]) or "", c.get("uuid", ""),
+                                 int(bool(c.get("enable", True))), up, dn, up + dn, _gb(up + dn)])
+        # Второй проход по снимкам в памяти: heap на TOP_N элементов, без сортировки всех клиентов
+        top = heapq.nlargest(TOP_N, rows(), key=lambda r: r[1].get("bytes_in", 0) + r[1].get("bytes_out", 0))
+
+        scope = "все серверы" if sid == "*" else sid
+        lines = [
+            f"<b>Трафик: {html.escape(scope)}</b> ({count} клиентов)",
+            f"Σ ⬆ {_gb(total_up)} ГБ ⬇ {_gb(total_dn)} ГБ",
+            "",
+            f"<b>Топ-{len(top)}:</b>",
+            *(f"{i}. <code>{html.escape(c['email'])}</code> ({html.escape(s)}) "
+              f"{_gb(c.get('bytes_in', 0) + c.get('bytes_out', 0))} ГБ"
+              for i, (s, c) in enumerate(top, 1)),
+            "",
+            "<b>По inbound:</b>",
+            *(f"{html.escape(s)} #{ib}: {n} кл., ⬆ {_gb(up)} ⬇ {_gb(dn)} ГБ"
+              for (s, ib), (n, up, dn) in sorted(inbounds.items(), key=lambda kv: (kv[0][0], kv[0][1] or 0))),
+        ]
+        missing = [s for s in SERVERS_CFG if sid == "*" and s not in snaps]
+        if missing:
+            lines += ["", f"⚠️ Нет данных: {html.escape(', '.join(missing))}"]
+        await safe_send(progress.edit_text, _join_lines(lines, app_settings.MAX_MSG_LEN), parse_mode="HTML",
+                        reply_markup=kb, priority=ADMIN)
+        name = f"traffic_{'all' if sid == '*' else sid}_{datetime.now():%Y%m%d_%H%M}.csv"
+        await safe_send(bot.send_document, progress.chat_id, FSInputFile(path, filename=name),
+                        caption=f"Трафик: {scope}", priority=ADMIN)
+    finally:
+        os.unlink(path)
+
+
+async def run_provision(bot, progress: MessageRef, sid: str, names: list[str]):
+    """Массовое создание клиентов на сервере sid (лимит сервера не применяется, как у админа)."""
+    clients = await server_manager.list_clients(sid)
+    existing = {c["email"].lower() for c in clients}
+    links, skipped, errors = [], [], []
+    async with ProgressReporter(progress, len(names), "➕ Создание клиентов…",
+                                details=lambda: f"✅ {len(links)}  ⏭ {len(skipped)}  ⚠️ {len(errors)}") as reporter:
+        for email in names:
+            if email in existing:
+                skipped.append(email)
+            else:
+                try:
+                    inbound_id = place_inbound(SERVERS_CFG[sid], clients)
+                    await server_manager.create_client(sid, inbound_id, email, 0, skip_limit=True)
+                    clients.append({"email": email, "inbound_id": inbound_id})  # учитываем в следующем выборе
+                    links.append(build_vless(SERVERS_CFG[sid], email))
+                except Exception as e:
+                    errors.append(f"{email} — {e}")
+            reporter.advance()
+        inventory.invalidate(sid)
+        await reporter.finish(
+            f"🏁 Создано {len(links)}, пропущено {len(skipped)}, ошибок {len(errors)} (сервер {sid})",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_button()]]))
+    report = "\n".join(links + ([""] + errors if errors else []))
+    if report:
+        await safe_send(bot.send_document, progress.chat_id,
+                        BufferedInputFile(report.encode(), f"clients_{sid}.txt"),
+                        caption="Ссылки новых клиентов", priority=ADMIN)
+
+
+JOBS = {
+    "broadcast": run_broadcast,
+    "sync_reminders": run_sync_reminders,
+    "traffic_report": run_traffic_report,
+    "provision": run_provision,
+    "migration": run_migration,
+}
+# Рассылки — в отдельную очередь: её воркер запускают с -c 1, чтобы не делить лимит Bot API
+JOB_QUEUES = {"broadcast": "bulk"}
+# Повтор после падения воркера разослал бы сообщения ещё раз — такие задачи без acks_late
+AT_MOST_ONCE = {"broadcast", "provision"}
+
+
+def _job_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.opt(exception=task.exception()).error("Фоновая задача завершилась с ошибкой")
+
+
+async def submit(bot, name: str, progress: MessageRef, *args):
+    """
+    Запускает задачу: в Celery-воркере при USE_WORKERS, иначе фоном в процессе бота.
+    Прогресс в обоих случаях пишется в сообщение progress.
+    """
+    if app_settings.USE_WORKERS:
+        from worker import celery_app
+        # send_task ходит в брокер синхронно — не блокируем event loop
+        await asyncio.to_thread(
+            celery_app.send_task, "worker.run_job_once" if name in AT_MOST_ONCE else "worker.run_job",
+            args=(name, progress.chat_id, progress.message_id, *args),
+            queue=JOB_QUEUES.get(name, "celery"),
+        )
+        logger.info("Задача {} отправлена воркеру", name)
+        return
+    task = asyncio.create_task(JOBS[name](bot, progress, *args))
+    _background.add(task)
+    task.add_done_callback(_job_done)
@@ -0,0 +1,76 @@
+"""
+Кэш готовой ссылки vless:// и клавиатуры «Скопировать» по tg_id.
+Вернувшийся пользователь получает ссылку без обращений к панелям.
+
+Запись устаревает:
+- по TTL (LINK_CACHE_TTL);
+- при удалении клиента (профиль, админ, перенос) — invalidate(tg_id).
+Инвалидации расходятся по остальным процессам бота событиями (services.storage).
+Параметры серверов читаются при старте, поэтому их смена — рестарт с пустым кэшем.
+"""
+from dataclasses import dataclass
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CopyTextButton
+
+from config import app_settings, SERVERS_CFG
+from api.http import build_vless
+from services import storage
+from services.expiring import ExpiringDict
+
+
+@dataclass(frozen=True)
+class CachedLink:
+    sid: str
+    email: str
+    link: str
+    keyboard: InlineKeyboardMarkup
+
+
+def tg_id_of(email: str) -> int | None:
+    prefix, sep, _ = email.partition("_")
+    return int(prefix) if sep and prefix.isdigit() else None
+
+
+class LinkCache:
+    def __init__(self, ttl: float, maxsize: int = 100_000):
+        self._data = ExpiringDict(ttl, maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tg_id: int) -> CachedLink | None:
+        entry = self._data.get(tg_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, tg_id: int, sid: str, email: str) -> CachedLink:
+        link = build_vless(SERVERS_CFG[sid], email)
+        entry = CachedLink(
+            sid=sid,
+            email=email,
+            link=link,
+            keyboard=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="📋 Скопировать", copy_text=CopyTextButton(text=link))]
+            ]),
+        )
+        self._data.set(tg_id, entry)
+        return entry
+
+    def invalidate(self, tg_id: int | None, publish: bool = True):
+        if tg_id is not None:
+            self._data.pop(tg_id)
+            if publish:
+                storage.publish_soon("link", tg_id=tg_id)
+
+    def stats_text(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        # Каждое попадание экономит поиск по панелям: до одного list_clients на сервер
+        return (f"Кэш ссылок: {len(self._data)} записей, попаданий {self.hits}/{total} ({rate:.0f}%), "
+                f"сэкономлено до {self.hits * len(SERVERS_CFG)} запросов к панелям")
+
+
+links = LinkCache(app_settings.LINK_CACHE_TTL)
+storage.on_event("link", lambda e: links.invalidate(e["tg_id"], publish=False))
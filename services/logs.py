@@ -0,0 +1,83 @@
+"""
+Логирование: маскирование секретов одним предкомпилированным регэкспом,
+файловый sink с фоновой записью (enqueue) и прореживание DEBUG-записей.
+
+    setup_logging()                 # в main / воркерах, один раз на процесс
+    logger.debug("апдейт {}", uid)  # каждая LOG_DEBUG_SAMPLE-я запись с этой строки
+"""
+import re
+import sys
+from collections import Counter
+
+from loguru import logger
+
+from config import app_settings
+from services import codec
+
+# Один проход по сообщению: ключ=значение для секретов или email.
+# Ключ — любое слово, оканчивающееся на token/password/… (bot_token, TELEGRAM_TOKEN);
+# значение — {…}, […], строка в кавычках целиком или одно слово (с bearer).
+REDACT_RE = re.compile(
+    r"(?P<key>\w*(?:token|password|secret|authorization|cookies?))[\"']?[=: ]+"
+    r"(?:\{[^}]*\}|\[[^\]]*\]|\"[^\"]*\"|'[^']*'|(?:bearer\s+)?[^\s,;]+)"
+    r"|[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+",
+    re.IGNORECASE,
+)
+
+
+def _mask(m: re.Match) -> str:
+    key = m.group("key")
+    return f"{key}=***" if key else "***@***"
+
+
+def redact(text: str) -> str:
+    return REDACT_RE.sub(_mask, text)
+
+
+_debug_seen: Counter = Counter()
+
+
+def _patch(record):
+    record["message"] = redact(record["message"])
+    # DEBUG: пишется раз в LOG_DEBUG_SAMPLE записей с одного места в коде
+    if record["level"].no <= 10 and app_settings.LOG_DEBUG_SAMPLE > 1:
+        key = (record["name"], record["line"])
+        _debug_seen[key] += 1
+        record["extra"]["_drop"] = _debug_seen[key] % app_settings.LOG_DEBUG_SAMPLE != 1
+
+
+def _sample(record) -> bool:
+    return not record["extra"].get("_drop")
+
+
+def _json_format(record) -> str:
+    record["extra"]["_json"] = codec.dumps({
+        "ts": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "func": record["function"],
+        "line": record["line"],
+        "msg": record["message"],
+        "extra": {k: v for k, v in record["extra"].items() if not k.startswith("_")},
+        "exc": redact(str(record["exception"].value)) if record["exception"] else None,
+    }, default=str)
+    return "{extra[_json]}\n"
+
+
+def setup_logging(path: str | None = None):
+    level = app_settings.LOG_LEVEL
+    logger.configure(
+        handlers=[{"sink": sys.stderr, "level": level, "filter": _sample}],
+        patcher=_patch,
+    )
+    logger.add(
+        path or app_settings.LOG_PATH,
+        level=level,
+        filter=_sample,
+        format=_json_format if app_settings.LOG_JSON else
+        "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}",
+        # Запись на диск — в фоновом потоке, хендлеры не ждут I/O
+        enqueue=True,
+        rotation="10 MB", retention="10 days", compression="zip",
+        backtrace=True, diagnose=False,
+    )
@@ -0,0 +1,93 @@
+"""
+Проверка подписки на канал CHANNEL_ID с кэшем.
+Положительный и отрицательный ответы живут разное время; одновременные
+проверки одного пользователя сливаются в один getChatMember. Если бот —
+админ канала, апдейты chat_member обновляют кэш сразу при вступлении/выходе
+(во всех процессах бота — событием через services.storage).
+"""
+import asyncio
+
+from loguru import logger
+
+from config import app_settings
+from services import storage
+from services.expiring import ExpiringDict
+from services.telegram_utils import safe_send
+
+MEMBER_STATUSES = {"member", "administrator", "creator"}
+
+
+def is_member_status(member) -> bool:
+    return member.status in MEMBER_STATUSES or (member.status == "restricted" and getattr(member, "is_member", False))
+
+
+class MembershipCache:
+    def __init__(self, positive_ttl: float, negative_ttl: float):
+        self._positive = ExpiringDict(positive_ttl)
+        self._negative = ExpiringDict(negative_ttl)
+        self._inflight: dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.requests = 0
+
+    def set(self, user_id: int, member: bool):
+        if member:
+            self._negative.pop(user_id)
+            self._positive.set(user_id, True)
+        else:
+            self._positive.pop(user_id)
+            self._negative.set(user_id, True)
+
+    def update(self, user_id: int, member: bool):
+        """Изменение из апдейта chat_member — и для остальных процессов."""
+        self.set(user_id, member)
+        storage.publish_soon("member", user_id=user_id, member=member)
+
+    async def is_member(self, bot, user_id: int) -> bool:
+        if app_settings.CHANNEL_ID is None:
+            return True
+        if user_id in self._positive:
+            self.hits += 1
+            return True
+        if user_id in self._negative:
+            self.hits += 1
+            return False
+        fut = self._inflight.get(user_id)
+        if fut is not None:
+            self.hits += 1
+            result = await asyncio.shield(fut)
+            # None — владелец запроса отменён: проверяем заново (сами или с новым запросом)
+            return result if result is not None else await self.is_member(bot, user_id)
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = fut
+        try:
+            result = await self._fetch(bot, user_id)
+            if result is None:
+                # Ошибку Telegram не кэшируем: следующая проверка спросит снова
+                result = False
+            else:
+                self.set(user_id, result)
+            fut.set_result(result)
+            return result
+        except BaseException:
+            # Отмена или сбой владельца — не их ошибка: ожидающие получают None и проверяют заново
+            fut.set_result(None)
+            raise
+        finally:
+            del self._inflight[user_id]
+
+    def stats_text(self) -> str:
+        return f"Подписка: из кэша {self.hits}, запросов getChatMember {self.requests}"
+
+    async def _fetch(self, bot, user_id: int) -> bool | None:
+        """None — Telegram не ответил, статус неизвестен."""
+        self.requests += 1
+        try:
+            member = await safe_send(bot.get_chat_member, app_settings.CHANNEL_ID, user_id)
+        except Exception as e:
+            logger.warning("getChatMember {}: {}", user_id, e)
+            return None
+        return is_member_status(member)
+
+
+membership = MembershipCache(app_settings.MEMBERSHIP_TTL, app_settings.MEMBERSHIP_NEGATIVE_TTL)
+storage.on_event("member", lambda e: membership.set(e["user_id"], e["member"]))
@@ -0,0 +1,303 @@
+"""
+Перенос клиентов между серверами.
+
+Планировщик (plan) раскладывает клиентов по политике выдачи: как pick_least_loaded —
+к минимальной загрузке, не больше MAX_CLIENTS на сервер. Переносы идут с самого
+загруженного сервера на самый свободный, пока разница больше одного клиента
+(или пока сервер drain не опустеет). Переносятся только клиенты бота (email tg_id_…),
+первыми — давно не бывшие онлайн.
+
+Исполнитель (execute) ведёт каждый перенос по шагам, состояние хранится в migration_moves:
+  planned  -> клиент создан на новом сервере            -> created
+  created  -> пользователю отправлена новая ссылка      -> notified (+ delete_after)
+  notified -> после MIGRATION_GRACE_HOURS удалён со старого -> done
+После MAX_ATTEMPTS неудач подряд на любом шаге перенос помечается failed.
+Прерванный план продолжается с сохранённого шага (/migrate resume); удаление
+по истечении grace делает задача планировщика finish_due.
+Новый план создаётся под локом (create_plan) и только если нет незавершённых.
+"""
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from aiogram.types import InlineKeyboardMarkup
+from loguru import logger
+from sqlalchemy import select, func
+
+from config import app_settings, SERVERS_CFG
+from api.http import build_vless
+from db import SessionLocal, MigrationMove
+from keyboards import back_button
+from services.core import server_manager
+from services.inventory import inventory
+from services.link_cache import links, tg_id_of
+from services import storage
+from services.presence import presence
+from services.progress import ProgressReporter, MessageRef
+from services.send_queue import BULK
+from services.telegram_utils import safe_send
+from services.user_ops import user_ops, RELEASE_LUA
+
+PLANNED, CREATED, NOTIFIED, DONE, SKIPPED, FAILED = "planned", "created", "notified", "done", "skipped", "failed"
+ACTIVE = (PLANNED, CREATED, NOTIFIED)
+MAX_ATTEMPTS = 3
+PLAN_LOCK_TTL = 300  # секунд: построение плана — один проход по снимкам
+
+NOTIFY_TEXT = (
+    "🔄 Ваш ключ перенесён на другой сервер.\n"
+    "Новая ссылка:\n<code>{link}</code>\n\n"
+    "Замените ключ в приложении — старый перестанет работать через {hours:g} ч."
+)
+
+
+async def plan(max_moves: int | None = None, drain: str | None = None) -> list[dict]:
+    """Список переносов {email, tg_id, src, src_inbound, client_id, dst}; ничего не сохраняет (dry-run)."""
+    max_moves = max_moves or app_settings.MIGRATION_MAX_MOVES
+    snaps = await inventory.get_all(max_age=0)
+    loads = {sid: len(snap) for sid, snap in snaps.items()}
+    targets = [sid for sid in loads if sid != drain]
+    if not targets or (drain is not None and drain not in loads):
+        return []
+
+    def movable(sid: str) -> list[dict]:
+        online = presence.online(sid) or frozenset()
+        clients = [c for c in snaps[sid].clients if tg_id_of(c["email"]) is not None]
+        # Сначала офлайн, из них — давно не заходившие
+        return sorted(clients, key=lambda c: (c["email"] in online, presence.last_seen(sid, c["email"])))
+
+    candidates = {sid: movable(sid) for sid in loads}
+    moves = []
+    while len(moves) < max_moves:
+        src = drain or max((s for s in loads if candidates[s]), key=loads.get, default=None)
+        if src is None or not candidates[src]:
+            break
+        dst = min(targets, key=loads.get)
+        if loads[dst] >= app_settings.MAX_CLIENTS:
+            break
+        if drain is None and loads[src] - loads[dst] <= 1:
+            break
+        c = candidates[src].pop(0)
+        # Не переносим на сервер, где клиент с таким email уже есть
+        if snaps[dst].get(c["email"]) is not None:
+            continue
+        moves.append({
+            "email": c["email"], "tg_id": tg_id_of(c["email"]), "src": src,
+            "src_inbound": c["inbound_id"], "client_id": c.get("uuid") or c["email"], "dst": dst,
+        })
+        loads[src] -= 1
+        loads[dst] += 1
+    return moves
+
+
+def plan_text(moves: list[dict]) -> str:
+    if not moves:
+        return "Перенос не нужен: нагрузка распределена."
+    routes: dict[tuple[str, str], int] = {}
+    for m in moves:
+        routes[(m["src"], m["dst"])] = routes.get((m["src"], m["dst"]), 0) + 1
+    return "\n".join([f"Переносов: {len(moves)}", *(f"{s} → {d}: {n}" for (s, d), n in sorted(routes.items()))])
+
+
+class MigrationBusy(RuntimeError):
+    pass
+
+
+_plan_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def _exclusive_plan():
+    """Один создаваемый план на все процессы (лок в Redis при STORAGE_BACKEND=redis)."""
+    if _plan_lock.locked():
+        raise MigrationBusy("План уже создаётся")
+    async with _plan_lock:
+        if not storage.use_redis():
+            yield
+            return
+        redis, key, token = storage.get_redis(), "migration:plan", uuid.uuid4().hex
+        if not await redis.set(key, token, nx=True, ex=PLAN_LOCK_TTL):
+            raise MigrationBusy("План уже создаётся")
+        try:
+            yield
+        finally:
+            await redis.register_script(RELEASE_LUA)(keys=[key], args=[token])
+
+
+async def create_plan(max_moves: int | None = None, drain: str | None = None) -> tuple[str | None, list[dict]]:
+    """Строит и сохраняет план; (None, []) — переносить нечего. MigrationBusy — есть незавершённый."""
+    async with _exclusive_plan():
+        if await active_count():
+            raise MigrationBusy("Есть незавершённые переносы: /migrate resume или /migrate status")
+        moves = await plan(max_moves, drain)
+        return (await save_plan(moves) if moves else None), moves
+
+
+async def save_plan(moves: list[dict]) -> str:
+    plan_id = uuid.uuid4().hex[:8]
+    async with SessionLocal() as s:
+        s.add_all(MigrationMove(plan_id=plan_id, state=PLANNED, **m) for m in moves)
+        await s.commit()
+    logger.info("Migration {}: сохранено {} переносов", plan_id, len(moves))
+    return plan_id
+
+
+async def active_count() -> int:
+    async with SessionLocal() as s:
+        return await s.scalar(select(func.count()).select_from(MigrationMove).where(MigrationMove.state.in_(ACTIVE)))
+
+
+async def in_flight(tg_id: int) -> tuple[str, str] | None:
+    """(src, dst) переноса, при котором клиент есть на обоих серверах; иначе None."""
+    async with SessionLocal() as s:
+        row = (await s.execute(
+            select(MigrationMove.src, MigrationMove.dst)
+            .where(MigrationMove.tg_id == tg_id, MigrationMove.state.in_((CREATED, NOTIFIED)))
+            .order_by(MigrationMove.id.desc()).limit(1)
+        )).first()
+    return tuple(row) if row else None
+
+
+async def status_text() -> str:
+    async with SessionLocal() as s:
+        rows = (await s.execute(
+            select(MigrationMove.state, func.count()).group_by(MigrationMove.state)
+        )).all()
+    if not rows:
+        return "Переносов не было."
+    return "Переносы: " + ", ".join(f"{state} {n}" for state, n in sorted(rows))
+
+
+async def _save(move: MigrationMove, **values):
+    async with SessionLocal() as s:
+        row = await s.get(MigrationMove, move.id)
+        for k, v in values.items():
+            setattr(row, k, v)
+            setattr(move, k, v)
+        await s.commit()
+
+
+async def _create(move: MigrationMove):
+    async def create() -> bool:
+        src = await inventory.get(move.src)
+        if src.get(move.email) is None:
+            return False  # пользователь удалил профиль, пока перенос ждал
+        dst = await inventory.get(move.dst, max_age=0)
+        if dst.get(move.email) is None:
+            inbound_id = await server_manager.pick_inbound(move.dst)
+            await server_manager.create_client(move.dst, inbound_id, move.email, move.tg_id)
+            inventory.invalidate(move.dst)
+        return True
+
+    if await user_ops.run(move.tg_id, "migrate:create", create):
+        await _save(move, state=CREATED, error=None, attempts=0)
+    else:
+        await _save(move, state=SKIPPED, error="нет на исходном сервере")
+
+
+async def _notify(bot, move: MigrationMove):
+    cfg = SERVERS_CFG[move.dst]
+    # Другие процессы сбрасывают ссылку на старый сервер; здесь /start сразу отдаёт новую
+    links.invalidate(move.tg_id)
+    links.put(move.tg_id, move.dst, move.email)
+    hours = app_settings.MIGRATION_GRACE_HOURS
+    error = None
+    try:
+        await safe_send(bot.send_message, move.tg_id,
+                        NOTIFY_TEXT.format(link=build_vless(cfg, move.email), hours=hours),
+                        parse_mode="HTML", priority=BULK)
+    except Exception as e:
+        # Недоставленное уведомление перенос не останавливает: новая ссылка — по /start
+        error = f"уведомление: {e.__class__.__name__}"
+    await _save(move, state=NOTIFIED, error=error, attempts=0,
+                delete_after=datetime.now(timezone.utc) + timedelta(hours=hours))
+
+
+async def _delete(move: MigrationMove):
+    async def delete():
+        # Повтор после сбоя или параллельный finish_due: клиента уже нет — шаг выполнен
+        src = await inventory.get(move.src, max_age=0)
+        if src.get(move.email) is not None:
+            await server_manager.delete_client(move.src, move.src_inbound, move.client_id)
+            inventory.remove(move.src, move.email)
+        # Во всех процессах: иначе кэш может отдавать ссылку на удалённый ключ
+        links.invalidate(move.tg_id)
+
+    await user_ops.run(move.tg_id, "migrate:delete", delete)
+    await _save(move, state=DONE)
+
+
+def _due(move: MigrationMove, now: datetime) -> bool:
+    at = move.delete_after
+    if at is not None and at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)  # SQLite не хранит зону
+    return at is not None and at <= now
+
+
+async def _advance(bot, move: MigrationMove):
+    """Проводит перенос по шагам, насколько возможно сейчас."""
+    try:
+        if move.state == PLANNED:
+            await _create(move)
+        if move.state == CREATED:
+            await _notify(bot, move)
+        if move.state == NOTIFIED and _due(move, datetime.now(timezone.utc)):
+            await _delete(move)
+    except Exception as e:
+        # Попытки считаются на шаг: после MAX_ATTEMPTS неудач подряд перенос больше не повторяется
+        attempts = move.attempts + 1
+        logger.warning("Migration {} {} {}→{} ({}): {}", move.plan_id, move.email, move.src, move.dst, move.state, e)
+        await _save(move, attempts=attempts, error=f"{move.state}: {e}"[:200],
+                    state=FAILED if attempts >= MAX_ATTEMPTS else move.state)
+
+
+async def _active_moves(plan_id: str | None = None) -> list[MigrationMove]:
+    query = select(MigrationMove).where(MigrationMove.state.in_(ACTIVE)).order_by(MigrationMove.id)
+    if plan_id:
+        query = query.where(MigrationMove.plan_id == plan_id)
+    async with SessionLocal() as s:
+        return list((await s.execute(query)).scalars().all())
+
+
+async def execute(bot, moves: list[MigrationMove], concurrency: int | None = None, on_step=None):
+    sem = asyncio.Semaphore(concurrency or app_settings.MIGRATION_CONCURRENCY)
+
+    async def one(move: MigrationMove):
+        async with sem:
+            await _advance(bot, move)
+        if on_step:
+            on_step(move)
+
+    await asyncio.gather(*(one(m) for m in moves))
+
+
+async def finish_due():
+    """Задача планировщика: удаляет со старых серверов клиентов, у которых истёк grace."""
+    now = datetime.now(timezone.utc)
+    due = [m for m in await _active_moves() if m.state == NOTIFIED and _due(m, now)]
+    if due:
+        await execute(None, due)
+        logger.info("Migration: удалено со старых серверов {}", sum(m.state == DONE for m in due))
+
+
+async def run_migration(bot, progress: MessageRef, plan_id: str | None = None):
+    """Задача jobs: выполняет план plan_id или все незавершённые переносы."""
+    kb = InlineKeyboardMarkup(inline_keyboard=[[back_button()]])
+    moves = await _active_moves(plan_id)
+    counts: dict[str, int] = {}
+
+    def step(move: MigrationMove):
+        counts[move.state] = counts.get(move.state, 0) + 1
+        reporter.advance()
+
+    async with ProgressReporter(progress, len(moves), "🔄 Перенос клиентов…",
+                                details=lambda: ", ".join(f"{k} {v}" for k, v in sorted(counts.items()))) as reporter:
+        await execute(bot, moves, on_step=step)
+        waiting = counts.get(NOTIFIED, 0)
+        await reporter.finish(
+            f"🏁 Перенос {plan_id or 'незавершённых'}: "
+            + (", ".join(f"{k} {v}" for k, v in sorted(counts.items())) or "нечего делать")
+            + (f"\nСо старых серверов удалятся через {app_settings.MIGRATION_GRACE_HOURS:g} ч: {waiting}" if waiting else ""),
+            reply_markup=kb)
+    for sid in {m.src for m in moves} | {m.dst for m in moves}:
+        inventory.invalidate(sid)
@@ -0,0 +1,175 @@
+"""
+Трекер онлайна: фоном опрашивает onlines всех серверов раз в PRESENCE_INTERVAL,
+сравнивает с прошлым опросом (события «подключился»/«отключился») и ведёт
+last-seen по (sid, email). Карта last-seen периодически сохраняется в БД
+(client_presence) одним upsert, при старте загружается обратно; записи клиентов,
+которых нет в снимке inventory сервера, при сохранении удаляются.
+Панели опрашивает один процесс (RUN_BACKGROUND), остальные процессы бота
+получают результат опроса событием через services.storage.
+Админские меню берут онлайн отсюда — без запроса к панели на каждое открытие.
+"""
+import asyncio
+import heapq
+import time
+from collections import deque
+
+from loguru import logger
+from sqlalchemy import select, delete, tuple_
+
+from config import app_settings
+from db import SessionLocal, ClientPresence, engine
+from services import storage
+from services.core import server_manager
+
+CAME, WENT = "online", "offline"
+
+
+def _upsert():
+    """INSERT … ON CONFLICT DO UPDATE: все строки одним executemany, без SELECT на строку."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(ClientPresence)
+    return stmt.on_conflict_do_update(
+        index_elements=["sid", "email"], set_={"last_seen": stmt.excluded.last_seen},
+    )
+
+
+class PresenceTracker:
+    def __init__(self, interval: float, persist_every: float):
+        self.interval = interval
+        self.persist_every = persist_every
+        self._online: dict[str, frozenset[str]] = {}
+        self._polled_at: dict[str, float] = {}
+        self._last_seen: dict[str, dict[str, int]] = {}  # sid -> email -> unix-время
+        self._stored: dict[tuple[str, str], int] = {}    # что уже записано в БД
+        self._dirty: set[tuple[str, str]] = set()
+        self.events: deque = deque(maxlen=500)  # (ts, sid, email, CAME|WENT)
+        self._task: asyncio.Task | None = None
+
+    # ---------- чтение ----------
+    def online(self, sid: str) -> frozenset[str] | None:
+        """Онлайн сервера по последнему опросу; None — данных ещё нет."""
+        return self._online.get(sid)
+
+    def online_count(self, sid: str) -> int:
+        return len(self._online.get(sid, ()))
+
+    def age(self, sid: str) -> float | None:
+        at = self._polled_at.get(sid)
+        return time.time() - at if at else None
+
+    def last_seen(self, sid: str, email: str) -> int:
+        return self._last_seen.get(sid, {}).get(email, 0)
+
+    def recently_offline(self, sid: str, limit: int = 10) -> list[tuple[str, int]]:
+        online = self._online.get(sid, frozenset())
+        seen = ((email, ts) for email, ts in self._last_seen.get(sid, {}).items() if email not in online)
+        return heapq.nlargest(limit, seen, key=lambda x: x[1])
+
+    # ---------- опрос ----------
+    def apply(self, sid: str, emails, now: float | None = None):
+        """Новый набор онлайна сервера: события по разнице с прошлым и обновление last-seen."""
+        now = now or time.time()
+        current = frozenset(emails or ())
+        previous = self._online.get(sid)
+        if previous is not None:
+            for email in current - previous:
+                self.events.append((now, sid, email, CAME))
+            for email in previous - current:
+                self.events.append((now, sid, email, WENT))
+        ts = int(now)
+        seen = self._last_seen.setdefault(sid, {})
+        for email in current:
+            seen[email] = ts
+            # В БД пишем, только когда сохранённое значение устарело больше чем на persist_every
+            if ts - self._stored.get((sid, email), 0) >= self.persist_every:
+                self._dirty.add((sid, email))
+        self._online[sid] = current
+        self._polled_at[sid] = now
+
+    async def _poll(self, sid: str):
+        try:
+            emails = await asyncio.wait_for(server_manager.get_online_clients(sid), self.interval)
+            now = time.time()
+            self.apply(sid, emails, now)
+            await storage.publish("presence", sid=sid, emails=sorted(self._online[sid]), at=now)
+        except Exception as e:
+            # Один сервер не должен останавливать опрос остальных и следующие циклы
+            logger.debug("Presence {}: {}", sid, e)
+
+    async def _run(self, persist: bool):
+        last_persist = time.monotonic()
+        while True:
+            await asyncio.gather(*(self._poll(sid) for sid in server_manager.cfgs))
+            if persist and time.monotonic() - last_persist >= self.persist_every:
+                last_persist = time.monotonic()
+                try:
+                    await self.persist()
+                except Exception:
+                    logger.exception("Не удалось сохранить last-seen")
+            await asyncio.sleep(self.interval)
+
+    # ---------- хранение ----------
+    async def load(self):
+        async with SessionLocal() as s:
+            rows = (await s.execute(select(ClientPresence))).scalars().all()
+        for r in rows:
+            self._last_seen.setdefault(r.sid, {})[r.email] = r.last_seen
+            self._stored[(r.sid, r.email)] = r.last_seen
+        logger.info("Presence: загружено {} записей last-seen", len(rows))
+
+    def _prune(self) -> list[tuple[str, str]]:
+        """Записи клиентов, которых нет ни в снимке inventory сервера, ни в онлайне."""
+        from services.inventory import inventory
+        gone = []
+        for sid, seen in self._last_seen.items():
+            snap = inventory.peek(sid)
+            if snap is None:
+                continue
+            online = self._online.get(sid, frozenset())
+            gone += [(sid, email) for email in seen if email not in online and snap.get(email) is None]
+        for sid, email in gone:
+            del self._last_seen[sid][email]
+            self._stored.pop((sid, email), None)
+            self._dirty.discard((sid, email))
+        return gone
+
+    async def persist(self):
+        gone = self._prune()
+        dirty, self._dirty = self._dirty, set()
+        if not dirty and not gone:
+            return
+        rows = [{"sid": sid, "email": email, "last_seen": self._last_seen[sid][email]} for sid, email in dirty]
+        try:
+            async with SessionLocal() as s:
+                if rows:
+                    await s.execute(_upsert(), rows)
+                if gone:
+                    await s.execute(delete(ClientPresence).where(
+                        tuple_(ClientPresence.sid, ClientPresence.email).in_(gone)))
+                await s.commit()
+        except Exception:
+            self._dirty |= dirty  # попробуем в следующий раз
+            raise
+        self._stored.update(((r["sid"], r["email"]), r["last_seen"]) for r in rows)
+
+    def start(self, poll: bool = True, persist: bool = True):
+        """poll=False — процесс только получает результаты опроса от другого процесса."""
+        if poll and self._task is None:
+            self._task = asyncio.create_task(self._run(persist))
+
+    async def stop(self, persist: bool = True):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if persist:
+            try:
+                await self.persist()
+            except Exception:
+                logger.exception("Не удалось сохранить last-seen при остановке")
+
+
+presence = PresenceTracker(app_settings.PRESENCE_INTERVAL, app_settings.PRESENCE_PERSIST_EVERY)
+storage.on_event("presence", lambda e: presence.apply(e["sid"], e["emails"], e["at"]))
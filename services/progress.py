@@ -0,0 +1,142 @@
+import asyncio
+import time
+from typing import Callable
+
+from services.telegram_utils import safe_send
+from services.send_queue import ADMIN
+
+DEFAULT_INTERVAL = 3  # секунды между правками сообщения
+
+
+def get_progress_bar(current, total, length=10):
+    percent = current / total if total else 0
+    filled = int(percent * length)
+    bar = '▇' * filled + '▂' * (length - filled)
+    percent_str = f"{int(percent * 100)}%"
+    return f"{bar} {percent_str}"
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} с"
+    if seconds < 3600:
+        return f"{seconds // 60:.0f} мин {seconds % 60:.0f} с"
+    return f"{seconds // 3600:.0f} ч {seconds % 3600 // 60:.0f} мин"
+
+
+class MessageRef:
+    """Сообщение по (chat_id, message_id): прогресс можно править из фоновой задачи или воркера."""
+
+    def __init__(self, bot, chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    @classmethod
+    def of(cls, message) -> "MessageRef":
+        return cls(message.bot, message.chat.id, message.message_id)
+
+    def edit_text(self, text: str, **kwargs):
+        return self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+
+
+class ProgressReporter:
+    """
+    Прогресс длинной операции в одном сообщении.
+    Правит сообщение не чаще раза в interval секунд и только если текст изменился.
+    Счётчик ведётся через advance()/done либо читается из функции done=...
+
+        async with ProgressReporter(msg, total, "🔄 Синхронизация…") as rep:
+            for item in items:
+                ...
+                rep.advance()
+            await rep.finish("Готово")
+    """
+
+    def __init__(
+        self,
+        message,
+        total: int,
+        title: str,
+        done: Callable[[], int] | None = None,
+        details: Callable[[], str] | None = None,
+        interval: float = DEFAULT_INTERVAL,
+        reply_markup=None,
+    ):
+        self.message = message
+        self.total = total
+        self.title = title
+        self.interval = interval
+        self.reply_markup = reply_markup
+        self._done_fn = done
+        self._details = details
+        self._done = 0
+        self._started = time.monotonic()
+        self._last_text: str | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def done(self) -> int:
+        return self._done_fn() if self._done_fn else self._done
+
+    @done.setter
+    def done(self, value: int):
+        self._done = value
+
+    def advance(self, n: int = 1):
+        self._done += n
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    @property
+    def throughput(self) -> float:
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        rate = self.throughput
+        if not rate:
+            return None
+        return max(0, self.total - self.done) / rate
+
+    def render(self) -> str:
+        done = self.done
+        lines = [f"{self.title} {done} / {self.total}", get_progress_bar(done, self.total)]
+        if self._details:
+            lines.append(self._details())
+        eta = self.eta
+        lines.append(f"⚡ {self.throughput:.1f}/с" + (f" · ⏱ ~{format_duration(eta)}" if eta is not None else ""))
+        return "\n".join(lines)
+
+    async def _edit(self, text: str, **kwargs):
+        if text == self._last_text:
+            return
+        self._last_text = text
+        await safe_send(self.message.edit_text, text, silent=True, priority=ADMIN, **kwargs)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._edit(self.render(), reply_markup=self.reply_markup)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def finish(self, text: str, **kwargs):
+        self.stop()
+        await self._edit(text, **kwargs)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.stop()
@@ -0,0 +1,87 @@
+"""
+Готовность бота после старта. Прогрев (авторизация в панелях, кэш клиентов,
+синхронизация БД) идёт в фоне, бот при этом уже принимает апдейты.
+Хендлеры, которым нужна панель, помечены флагом panel:
+
+    @dp.callback_query(F.data == "user_menu", flags={"panel": True})
+
+до окончания прогрева (или дедлайна) вместо них отвечает ReadinessMiddleware.
+"""
+import asyncio
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message
+from loguru import logger
+
+from services.telegram_utils import safe_send
+
+WARMING_UP_TEXT = "⏳ Бот запускается, попробуйте через несколько секунд."
+
+_ready = asyncio.Event()
+_warm_task: asyncio.Task | None = None
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+async def _timed(name: str, coro, timings: dict[str, float]):
+    started = time.monotonic()
+    try:
+        return await coro
+    finally:
+        timings[name] = time.monotonic() - started
+
+
+async def warm_up(steps: dict[str, object], deadline: float):
+    """
+    Выполняет шаги прогрева параллельно. По дедлайну бот объявляется готовым,
+    даже если часть шагов не закончилась: они продолжают работать в фоне.
+    """
+    started = time.monotonic()
+    timings: dict[str, float] = {}
+    tasks = {asyncio.create_task(_timed(name, coro, timings)): name for name, coro in steps.items()}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    _ready.set()
+
+    lines = []
+    for task, name in tasks.items():
+        if task in pending:
+            lines.append(f"{name}: не успел за {deadline:.0f} с")
+        elif task.exception():
+            lines.append(f"{name}: ошибка за {timings[name]:.2f} с ({task.exception()})")
+        else:
+            lines.append(f"{name}: {timings[name]:.2f} с")
+    logger.info("Прогрев за {:.2f} с:\n{}", time.monotonic() - started, "\n".join(lines))
+    for task in pending:
+        task.add_done_callback(lambda t, name=tasks[task]: _late_done(name, t, timings))
+
+
+def _late_done(name: str, task: asyncio.Task, timings: dict[str, float]):
+    if task.cancelled():
+        return
+    if task.exception():
+        logger.warning("Прогрев: {} завершился ошибкой после дедлайна: {}", name, task.exception())
+    else:
+        logger.info("Прогрев: {} завершён после дедлайна ({:.2f} с)", name, timings[name])
+
+
+def start(steps: dict[str, object], deadline: float) -> asyncio.Task:
+    """Запускает прогрев фоном — on_startup не ждёт его, поллинг начинается сразу."""
+    global _warm_task
+    _warm_task = asyncio.create_task(warm_up(steps, deadline))
+    return _warm_task
+
+
+class ReadinessMiddleware(BaseMiddleware):
+    """Отвечает «бот запускается» на хендлеры с флагом panel, пока прогрев не закончен."""
+
+    async def __call__(self, handler, event, data):
+        if is_ready() or not get_flag(data, "panel"):
+            return await handler(event, data)
+        if isinstance(event, CallbackQuery):
+            await event.answer(WARMING_UP_TEXT)
+        elif isinstance(event, Message):
+            await safe_send(event.answer, WARMING_UP_TEXT, silent=True)
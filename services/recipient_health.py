@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from loguru import logger
+from sqlalchemy import update
+
+from db import SessionLocal, ReminderSetting
+from services import storage
+
+BLOCKED, DEACTIVATED, NOT_FOUND, TRANSIENT = "blocked", "deactivated", "not_found", "transient"
+PERMANENT = {BLOCKED, DEACTIVATED, NOT_FOUND}
+
+# Недоставляемые chat_id в памяти, чтобы middleware не ходила в БД на каждый апдейт
+_dead: set[int] = set()
+
+
+def classify(exc: Exception) -> str:
+    """Тип ошибки доставки: постоянная (чат мёртв) или временная."""
+    msg = (getattr(exc, "message", None) or str(exc)).lower()
+    if isinstance(exc, TelegramForbiddenError):
+        if "deactivated" in msg:
+            return DEACTIVATED
+        return BLOCKED  # blocked by the user / kicked / can't initiate conversation
+    if isinstance(exc, (TelegramBadRequest, TelegramNotFound)) and "chat not found" in msg:
+        return NOT_FOUND
+    return TRANSIENT
+
+
+async def load():
+    async with SessionLocal() as s:
+        rows = (await s.execute(
+            ReminderSetting.__table__.select().where(ReminderSetting.dead_reason.is_not(None))
+        )).all()
+    _dead.clear()
+    _dead.update(r.chat_id for r in rows)
+    logger.info("Недоставляемых получателей: {}", len(_dead))
+
+
+async def mark_dead(failures: list[tuple[int, str]]):
+    """Помечает чаты с постоянной ошибкой доставки, они выпадают из рассылок."""
+    failures = [(cid, kind) for cid, kind in failures if kind in PERMANENT]
+    if not failures:
+        return
+    now = datetime.now(timezone.utc)
+    async with SessionLocal() as s:
+        for cid, kind in failures:
+            await s.execute(
+                update(ReminderSetting)
+                .where(ReminderSetting.chat_id == cid)
+                .values(dead_reason=kind, dead_at=now)
+            )
+        await s.commit()
+    _dead.update(cid for cid, _ in failures)
+    # Рассылки идут и в Celery-воркерах — ReinstateMiddleware бота должна знать о новых записях
+    await storage.publish("dead", chat_ids=[cid for cid, _ in failures])
+    logger.info("Помечено недоставляемыми: {}", len(failures))
+
+
+async def reinstate(chat_id: int):
+    async with SessionLocal() as s:
+        await s.execute(
+            update(ReminderSetting)
+            .where(ReminderSetting.chat_id == chat_id)
+            .values(dead_reason=None, dead_at=None)
+        )
+        await s.commit()
+    _dead.discard(chat_id)
+    await storage.publish("alive", chat_id=chat_id)
+    logger.info("Получатель {} снова доступен", chat_id)
+
+
+storage.on_event("dead", lambda e: _dead.update(e["chat_ids"]))
+storage.on_event("alive", lambda e: _dead.discard(e["chat_id"]))
+
+
+class ReinstateMiddleware(BaseMiddleware):
+    """Пользователь снова написал боту — значит, он его не блокирует."""
+
+    async def __call__(self, handler, event, data):
+        user = getattr(event, "from_user", None)
+        if user and user.id in _dead:
+            await reinstate(user.id)
+        return await handler(event, data)
@@ -1,3 +1,5 @@
+from datetime import datetime
+from sqlalchemy import or_, update
 from db import SessionLocal, ReminderSetting
 from services.core import server_manager
 from config import SERVERS_CFG
@@ -25,10 +27,30 @@ async def toggle_enabled(chat_id: int) -> bool:
 async def list_enabled_chat_ids() -> list[int]:
     async with SessionLocal() as s:
         rows = (await s.execute(
-            ReminderSetting.__table__.select().where(ReminderSetting.enabled)
+            ReminderSetting.__table__.select()
+            .where(ReminderSetting.enabled, ReminderSetting.dead_reason.is_(None))
         )).all()
         return [r.chat_id for r in rows]
 
+async def list_due_chat_ids(since: datetime) -> list[int]:
+    """Включённые и доставляемые chat_id, которым с момента since ещё не напоминали."""
+    async with SessionLocal() as s:
+        rows = (await s.execute(
+            ReminderSetting.__table__.select().where(
+                ReminderSetting.enabled,
+                ReminderSetting.dead_reason.is_(None),
+                or_(ReminderSetting.reminded_at.is_(None), ReminderSetting.reminded_at < since),
+            )
+        )).all()
+        return [r.chat_id for r in rows]
+
+async def mark_reminded(chat_id: int, at: datetime):
+    async with SessionLocal() as s:
+        await s.execute(
+            update(ReminderSetting).where(ReminderSetting.chat_id == chat_id).values(reminded_at=at)
+        )
+        await s.commit()
+
 async def save_last_msg_id(chat_id: int, msg_id: int):
     async with SessionLocal() as s:
         obj = await s.get(ReminderSetting, chat_id) or ReminderSetting(chat_id=chat_id)
@@ -37,9 +59,11 @@ async def save_last_msg_id(chat_id: int, msg_id: int):
         await s.commit()
 
 async def list_all_chat_ids() -> list[int]:
-    """Все известные chat_id (не важно, включено ли напоминание)."""
+    """Все известные доставляемые chat_id (не важно, включено ли напоминание)."""
     async with SessionLocal() as s:
-        rows = (await s.execute(ReminderSetting.__table__.select())).all()
+        rows = (await s.execute(
+            ReminderSetting.__table__.select().where(ReminderSetting.dead_reason.is_(None))
+        )).all()
         return [r.chat_id for r in rows]
 
 async def list_all_clients():
@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass
+
+from loguru import logger
+
+from config import app_settings
+from services.throttle import TokenBucket
+
+# Классы приоритета: меньше — важнее
+INTERACTIVE, ADMIN, BULK = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", ADMIN: "admin", BULK: "bulk"}
+
+
+@dataclass
+class ClassMetrics:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    @property
+    def wait_avg(self) -> float:
+        done = self.completed + self.failed
+        return self.wait_total / done if done else 0.0
+
+
+class OutboundQueue:
+    """
+    Единая очередь исходящих вызовов Bot API.
+    Все отправители делят один token bucket; из очереди первым
+    уходит вызов с наивысшим приоритетом, внутри класса — FIFO.
+    """
+
+    def __init__(self, rate: float):
+        self.bucket = TokenBucket(rate)
+        self.metrics = {p: ClassMetrics() for p in PRIORITY_NAMES}
+        self._queue: asyncio.PriorityQueue | None = None
+        self._seq = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self.shared = None  # throttle.SharedBucket при нескольких процессах
+
+    def use_shared(self, bucket):
+        self.shared = bucket
+
+    def pause_shared(self, seconds: float):
+        """Flood-wait для остальных процессов (фоном: вызывается из синхронного кода)."""
+        if self.shared is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._pause_shared(seconds))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _pause_shared(self, seconds: float):
+        try:
+            await self.shared.pause(seconds)
+        except Exception as e:
+            logger.warning("Не удалось поставить общую паузу: {}", e)
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            if self._queue is None:
+                self._queue = asyncio.PriorityQueue()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def submit(self, func, *args, priority: int = INTERACTIVE, **kwargs):
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        self.metrics[priority].submitted += 1
+        self._queue.put_nowait((priority, next(self._seq), time.monotonic(), fut, func, args, kwargs))
+        return await fut
+
+    async def _dispatch(self):
+        while True:
+            priority, _, enqueued, fut, func, args, kwargs = await self._queue.get()
+            if fut.done():  # отправитель уже отменил ожидание
+                continue
+            await self.bucket.acquire()
+            if self.shared is not None:
+                try:
+                    await self.shared.acquire()
+                except Exception as e:
+                    # Redis недоступен — остаётся локальный лимит
+                    logger.warning("Общий лимит Bot API недоступен: {}", e)
+            m = self.metrics[priority]
+            wait = time.monotonic() - enqueued
+            m.wait_total += wait
+            m.wait_max = max(m.wait_max, wait)
+            task = asyncio.create_task(self._call(m, fut, func, args, kwargs))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _call(self, m: ClassMetrics, fut, func, args, kwargs):
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            m.failed += 1
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        m.completed += 1
+        self.bucket.on_success()
+        if not fut.done():
+            fut.set_result(result)
+
+    async def drain(self, timeout: float):
+        """Ждёт, пока очередь и начатые вызовы опустеют (при остановке бота)."""
+        deadline = time.monotonic() + timeout
+        while (self.depth or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.depth or self._inflight:
+            logger.warning("Исходящая очередь не опустела: {} в очереди, {} в работе", self.depth, len(self._inflight))
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats_text(self) -> str:
+        lines = [f"Очередь: {self.depth}, лимит {self.bucket.rate:.1f}/{self.bucket.target_rate:.0f} msg/s"]
+        for p, m in self.metrics.items():
+            lines.append(
+                f"{PRIORITY_NAMES[p]}: {m.completed} ok, {m.failed} err, "
+                f"ожидание ср. {m.wait_avg * 1000:.0f} мс / макс. {m.wait_max * 1000:.0f} мс"
+            )
+        return "\n".join(lines)
+
+    def log_stats(self):
+        logger.info("Исходящая очередь:\n{}", self.stats_text())
+
+
+outbound = OutboundQueue(app_settings.TG_RATE)
@@ -2,8 +2,29 @@ import asyncio
 import httpx
 from config import app_settings, ServerSettings
 from datetime import datetime, timedelta
-from aiocache import caches, cached
-import json
+from aiocache import caches
+from services import codec
+
+def place_inbound(cfg: ServerSettings, clients: list[dict]) -> int:
+    """
+    Inbound для нового клиента: из первых MAX_INBOUNDS id в INBOUNDS — наименее
+    загруженный по числу клиентов или, при INBOUND_BALANCE=traffic, по трафику.
+    При равенстве — первый по порядку в конфиге.
+    """
+    ids = cfg.inbound_ids[:app_settings.MAX_INBOUNDS]
+    if not ids:
+        raise RuntimeError("Нет inbound для новых клиентов: проверьте INBOUNDS и MAX_INBOUNDS")
+    count = dict.fromkeys(ids, 0)
+    traffic = dict.fromkeys(ids, 0)
+    for c in clients:
+        ib = c.get("inbound_id", c.get("inboundId"))
+        if ib in count:
+            count[ib] += 1
+            traffic[ib] += c.get("bytes_in", c.get("up", 0)) + c.get("bytes_out", c.get("down", 0))
+    if app_settings.INBOUND_BALANCE == "traffic":
+        return min(ids, key=lambda i: (traffic[i], count[i]))
+    return min(ids, key=count.get)
+
 
 class ServerManager:
     def __init__(self, cfgs: dict[str, ServerSettings]):
@@ -27,7 +48,7 @@ class ServerManager:
                     data={"username": cfg.USERNAME, "password": cfg.PASSWORD},
                 )
             resp.raise_for_status()
-            data = resp.json()
+            data = codec.response_json(resp)
             if not data.get("success"):
                 raise RuntimeError("Авторизация не удалась")
             cookies = resp.cookies
@@ -55,13 +76,13 @@ class ServerManager:
                 cookies=cookies,
             )
         resp.raise_for_status()
-        items = resp.json().get("obj", [])
+        items = codec.response_json(resp).get("obj", [])
         result = []
         for ib in items:
             inbound_id = ib["id"]
             # Парсим settings для получения UUID
             try:
-                settings = json.loads(ib["settings"])
+                settings = codec.loads(ib["settings"])
                 uuid_map = {c["email"]: c["id"] for c in settings.get("clients", [])}
             except Exception:
                 uuid_map = {}
@@ -90,6 +111,9 @@ class ServerManager:
         import random
         return random.choice(least_loaded)
 
+    async def pick_inbound(self, sid: str) -> int:
+        return place_inbound(self.cfgs[sid], await self.list_clients(sid))
+
     async def create_client(self, sid: str, inbound_id: int, email: str, tg_id: int, skip_limit=False):
         clients = await self.list_clients(sid)
         if not skip_limit and len(clients) >= app_settings.MAX_CLIENTS:
@@ -98,7 +122,7 @@ class ServerManager:
         cfg = self.cfgs[sid]
         payload = {
             "id": inbound_id,
-            "settings": __import__('json').dumps({"clients": [{
+            "settings": codec.dumps({"clients": [{
                 "id": email,
                 "email": email,
                 "flow": cfg.FLOW,
@@ -115,7 +139,8 @@ class ServerManager:
         async with httpx.AsyncClient(verify=cfg.VERIFY_SSL, timeout=10, limits=httpx.Limits(max_connections=app_settings.HTTPX_MAX_CONNECTIONS)) as client:
             resp = await client.post(
                 f"{cfg.BASE_URL}/panel/api/inbounds/addClient",
-                json=payload,
+                content=codec.dumps_bytes(payload),
+                headers=codec.JSON_HEADERS,
                 cookies=cookies,
             )
         resp.raise_for_status()
@@ -159,14 +184,14 @@ class ServerManager:
                 resp = await client_http.get(
                     f"{cfg.BASE_URL}/panel/api/inbounds/getClientTrafficsById/{cid}?inId={inbound_id}"
                 )
-            obj = self._extract_obj(resp.json())
+            obj = self._extract_obj(codec.response_json(resp))
         # 2) Если по ID не дали данных — пробуем по email
         if not obj and email:
             async with httpx.AsyncClient(cookies=cookies, verify=cfg.VERIFY_SSL, timeout=10) as client_http:
                 resp = await client_http.get(
                     f"{cfg.BASE_URL}/panel/api/inbounds/getClientTraffics/{email}"
                 )
-            obj = self._extract_obj(resp.json())
+            obj = self._extract_obj(codec.response_json(resp))
         up   = obj.get("uplink", obj.get("up", 0))
         down = obj.get("downlink", obj.get("down", 0))
         return {"uplink": up, "downlink": down}
@@ -178,9 +203,11 @@ class ServerManager:
         except Exception:
             return False
 
-    @cached(ttl=10)
     async def get_online_clients(self, sid: str) -> list[str]:
-        """Возвращает список email'ов онлайн-клиентов через POST /panel/api/inbounds/onlines (TTL 10 сек)."""
+        """
+        Список email'ов онлайн-клиентов через POST /panel/api/inbounds/onlines, без кэша:
+        опрашивает и хранит результат services.presence, остальным читать онлайн оттуда.
+        """
         cookies = await self._auth(sid)
         cfg = self.cfgs[sid]
         async with httpx.AsyncClient(cookies=cookies, verify=cfg.VERIFY_SSL, timeout=10) as client:
@@ -188,16 +215,14 @@ class ServerManager:
         if resp.status_code == 404:
             raise RuntimeError("API он-лайн недоступен; проверьте версию X-UI")
         resp.raise_for_status()
-        return resp.json()["obj"]
+        return codec.response_json(resp)["obj"]
 
     async def invalidate_cache(self, sid: str, what: str):
-        """Инвалидация кэша по типу ('clients', 'inbounds_list', 'onlines')."""
+        """Инвалидация кэша по типу ('clients', 'inbounds_list')."""
         if what == "clients":
             await caches.get('default').delete(f"api_clients:{sid}")
         elif what == "inbounds_list":
             await caches.get('default').delete(f"api_inbounds_list:{sid}")
-        elif what == "onlines":
-            await caches.get('default').delete(f"api_inbounds_onlines:{sid}")
 
     async def is_full(self, sid: str) -> bool:
         return len(await self.list_clients(sid)) >= app_settings.MAX_CLIENTS
@@ -0,0 +1,228 @@
+"""
+Хранилища состояния: FSM и счётчики rate limit / капча.
+STORAGE_BACKEND=memory (по умолчанию) — всё в памяти процесса;
+STORAGE_BACKEND=redis — общее состояние для нескольких экземпляров бота.
+
+Несколько процессов (SHARD_WORKERS > 1, USE_WORKERS) требуют redis: кроме FSM
+и rate limit через него идут общий лимит Bot API (throttle.SharedBucket) и
+события об изменении локальных кэшей (publish / on_event ниже).
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+
+from aiogram.fsm.storage.memory import MemoryStorage
+from loguru import logger
+
+from config import app_settings
+from services import codec
+from services.expiring import ExpiringDict
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        from redis.asyncio import Redis
+        _redis = Redis.from_url(app_settings.REDIS_URL)
+    return _redis
+
+
+async def close_redis():
+    global _redis, _listener
+    if _listener is not None:
+        _listener.cancel()
+        _listener = None
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+def use_redis() -> bool:
+    return app_settings.STORAGE_BACKEND == "redis"
+
+
+def require_shared(feature: str):
+    """Режимы с несколькими процессами без общего хранилища не запускаем."""
+    if not use_redis():
+        raise RuntimeError(f"{feature} требует STORAGE_BACKEND=redis: лимит Bot API и кэши должны быть общими")
+
+
+# ---------- События между процессами ----------
+# Процесс, изменивший свой кэш (links, membership, недоставляемые чаты, онлайн),
+# публикует событие; остальные применяют его к своей копии. Без redis — no-op.
+EVENTS_CHANNEL = "bot:events"
+_origin = uuid.uuid4().hex
+_handlers: dict = {}
+_pending: set[asyncio.Task] = set()
+_listener: asyncio.Task | None = None
+
+
+def on_event(kind: str, handler):
+    """handler(data: dict) — синхронная функция, вызывается для событий других процессов."""
+    _handlers[kind] = handler
+
+
+async def publish(kind: str, **data):
+    if not use_redis():
+        return
+    try:
+        await get_redis().publish(EVENTS_CHANNEL, codec.dumps({"kind": kind, "origin": _origin, **data}))
+    except Exception as e:
+        logger.warning("Событие {} не отправлено: {}", kind, e)
+
+
+def publish_soon(kind: str, **data):
+    """publish из синхронного кода: фоновая задача в текущем event loop."""
+    if not use_redis():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(publish(kind, **data))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+def _apply(raw):
+    event = codec.loads(raw)
+    if event.pop("origin", None) == _origin:
+        return
+    handler = _handlers.get(event.pop("kind", None))
+    if handler is not None:
+        try:
+            handler(event)
+        except Exception:
+            logger.exception("Ошибка обработки события {}", event)
+
+
+async def _listen():
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(EVENTS_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    _apply(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Подписка на события прервана: {}", e)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def start_events():
+    global _listener
+    if use_redis() and _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+def start_shared(listen: bool = True):
+    """В каждом процессе бота при redis: общий лимит Bot API и (если listen) приём событий."""
+    if not use_redis():
+        return
+    from services.send_queue import outbound
+    from services.throttle import SharedBucket
+    if outbound.shared is None:
+        outbound.use_shared(SharedBucket(get_redis(), app_settings.TG_RATE))
+    if listen:
+        start_events()
+
+
+def build_fsm_storage():
+    if use_redis():
+        from aiogram.fsm.storage.redis import RedisStorage
+        logger.info("FSM storage: Redis ({})", app_settings.REDIS_URL)
+        return RedisStorage(redis=get_redis())
+    return MemoryStorage()
+
+
+class MemoryRateLimitBackend:
+    """Скользящее окно и капча в памяти процесса."""
+
+    def __init__(self, captcha_ttl: float, window_ttl: float = 60, maxsize: int = 200_000):
+        self._hits: dict[str, ExpiringDict] = {}
+        self._window_ttl = window_ttl
+        self._maxsize = maxsize
+        self._captcha = ExpiringDict(captcha_ttl, maxsize=maxsize)
+
+    async def hit(self, kind: str, user_id: int, window: float, limit: int = 1) -> bool:
+        """Засчитывает событие, если в окне window меньше limit событий; иначе False."""
+        hits = self._hits.get(kind)
+        if hits is None:
+            hits = self._hits[kind] = ExpiringDict(max(window, self._window_ttl), maxsize=self._maxsize)
+        now = time.time()
+        q = hits.get(user_id) or deque()
+        while q and q[0] <= now - window:
+            q.popleft()
+        if len(q) >= limit:
+            return False
+        q.append(now)
+        hits.set(user_id, q)
+        return True
+
+    async def get_captcha(self, user_id: int) -> int | None:
+        return self._captcha.get(user_id)
+
+    async def set_captcha(self, user_id: int, answer: int):
+        self._captcha.set(user_id, answer)
+
+    async def clear_captcha(self, user_id: int):
+        self._captcha.pop(user_id)
+
+
+# Атомарное скользящее окно на ZSET: очистка, подсчёт и запись одним вызовом
+# Время — часы Redis (TIME), а не процесса: окно одно для всех экземпляров бота
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+if redis.call('ZCARD', key) >= limit then
+    return 0
+end
+redis.call('ZADD', key, now, ARGV[3])
+redis.call('PEXPIRE', key, math.ceil(window * 1000))
+return 1
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    То же в Redis — общее для всех экземпляров бота.
+    Принимает любой клиент с API redis.asyncio (в т.ч. fakeredis.aioredis.FakeRedis).
+    """
+
+    def __init__(self, redis, captcha_ttl: float, prefix: str = "rl"):
+        self.redis = redis
+        self.captcha_ttl = captcha_ttl
+        self.prefix = prefix
+        self._script = redis.register_script(SLIDING_WINDOW_LUA)
+
+    async def hit(self, kind: str, user_id: int, window: float, limit: int = 1) -> bool:
+        key = f"{self.prefix}:{kind}:{user_id}"
+        allowed = await self._script(keys=[key], args=[window, limit, uuid.uuid4().hex])
+        return bool(int(allowed))
+
+    async def get_captcha(self, user_id: int) -> int | None:
+        v = await self.redis.get(f"{self.prefix}:captcha:{user_id}")
+        return int(v) if v is not None else None
+
+    async def set_captcha(self, user_id: int, answer: int):
+        await self.redis.set(f"{self.prefix}:captcha:{user_id}", answer, ex=int(self.captcha_ttl))
+
+    async def clear_captcha(self, user_id: int):
+        await self.redis.delete(f"{self.prefix}:captcha:{user_id}")
+
+
+def build_rate_limit_backend(captcha_ttl: float):
+    if use_redis():
+        return RedisRateLimitBackend(get_redis(), captcha_ttl)
+    return MemoryRateLimitBackend(captcha_ttl)
@@ -1,19 +1,27 @@
-import asyncio
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest, TelegramForbiddenError
+from services import codec
+from services.send_queue import outbound, INTERACTIVE
+from services.flood_control import flood
 
-async def safe_send(send_func, *args, silent=False, **kwargs):
+def bot_session(**kwargs) -> AiohttpSession:
+    """Сессия Bot API с быстрым JSON-кодеком (разбор апдейтов и ответов, сериализация запросов)."""
+    return AiohttpSession(json_loads=codec.loads, json_dumps=codec.dumps, **kwargs)
+
+async def safe_send(send_func, *args, silent=False, priority=INTERACTIVE, **kwargs):
     max_attempts = 5
     for attempt in range(max_attempts):
         try:
-            return await send_func(*args, **kwargs)
+            return await outbound.submit(send_func, *args, priority=priority, **kwargs)
         except TelegramRetryAfter as e:
-            # aiogram 3: FloodWait/RetryAfter
-            await asyncio.sleep(getattr(e, 'retry_after', getattr(e, 'timeout', 5)))
+            # aiogram 3: FloodWait/RetryAfter — пауза для всех отправителей,
+            # повторная попытка дождётся её окончания в очереди
+            flood.trip(getattr(e, 'retry_after', getattr(e, 'timeout', 5)))
         except Exception as e:
             # Ловим любые другие ошибки Telegram, которые могут содержать retry info
             retry = getattr(e, 'retry_after', None) or getattr(e, 'timeout', None)
             if retry:
-                await asyncio.sleep(retry)
+                flood.trip(retry)
             elif isinstance(e, (TelegramBadRequest, TelegramForbiddenError)):
                 if silent:
                     return None
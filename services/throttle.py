@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Глобальный token bucket с адаптацией скорости.
+    При RetryAfter bucket ставится на паузу, а после неё стартует с min_rate
+    (slow start): скорость удваивается до половины прежней, затем растёт
+    на 1 msg/s за «раунд» успешных отправок до целевой.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None, min_rate: float = 1.0):
+        self.target_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._ssthresh = rate
+        self._successes = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @property
+    def paused_until(self) -> float:
+        return self._paused_until
+
+    def on_success(self):
+        if self.rate >= self.target_rate:
+            return
+        self._successes += 1
+        if self._successes < self.rate:
+            return
+        self._successes = 0
+        if self.rate < self._ssthresh:
+            self.rate = min(self._ssthresh, self.rate * 2)
+        else:
+            self.rate = min(self.target_rate, self.rate + 1)
+
+    def on_retry_after(self, retry_after: float):
+        now = time.monotonic()
+        # Пачка RetryAfter от вызовов, ушедших до паузы, — одно событие:
+        # продлеваем паузу, но порог не снижаем повторно
+        if now >= self._paused_until:
+            self._ssthresh = max(self.min_rate, self.rate / 2)
+            self.rate = self.min_rate
+        self._paused_until = max(self._paused_until, now + retry_after)
+        # Токены за время паузы не копятся: сразу после неё проходит один вызов
+        self._tokens = 1
+        self._updated = self._paused_until
+        self._successes = 0
+
+
+# Общий bucket в Redis: пополнение по времени сервера (TIME), пауза flood-wait — отдельный ключ.
+# Возвращает 0, если токен выдан, иначе сколько миллисекунд подождать.
+SHARED_BUCKET_LUA = """
+local pause = redis.call('PTTL', KEYS[2])
+if pause > 0 then
+    return pause
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], 60000)
+return wait
+"""
+
+# Пауза только продлевается
+SHARED_PAUSE_LUA = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+return 1
+"""
+
+
+class SharedBucket:
+    """
+    Лимит Bot API, общий для всех процессов бота (шарды, Celery-воркеры).
+    Стоит после локального TokenBucket: тот даёт slow start после RetryAfter
+    в своём процессе, этот — общий потолок rate и общую паузу flood-wait.
+    """
+
+    def __init__(self, redis, rate: float, capacity: float | None = None, prefix: str = "tg"):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._keys = [f"{prefix}:bucket", f"{prefix}:pause"]
+        self._acquire = redis.register_script(SHARED_BUCKET_LUA)
+        self._pause = redis.register_script(SHARED_PAUSE_LUA)
+
+    async def acquire(self):
+        while True:
+            wait = int(await self._acquire(keys=self._keys, args=[self.rate, self.capacity]))
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait / 1000)
+
+    async def pause(self, seconds: float):
+        await self._pause(keys=self._keys[1:], args=[int(seconds * 1000)])
+
+
+class ChatPacer:
+    """Минимальный интервал между сообщениями в один и тот же чат."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._next: dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        ready_at = self._next.get(chat_id, 0.0)
+        self._next[chat_id] = max(now, ready_at) + self.interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+        if len(self._next) > 10_000:
+            self._next = {cid: ts for cid, ts in self._next.items() if ts > now}
@@ -0,0 +1,114 @@
+"""
+Защита от параллельных операций одного пользователя (создание и удаление профиля).
+
+- Повтор той же операции, пока первая выполняется, не запускает её снова,
+  а дожидается и возвращает тот же результат; в течение RESULT_TTL после
+  завершения повтор получает сохранённый результат.
+- Разные операции одного пользователя выполняются строго по очереди.
+- При STORAGE_BACKEND=redis очередь общая для всех экземпляров бота (лок в Redis).
+  Между экземплярами повтор ждёт лок и выполняется заново, поэтому операции
+  должны быть идемпотентны (ensure_user_profile сначала ищет существующий профиль).
+"""
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from config import app_settings
+from services import storage
+from services.expiring import ExpiringDict
+
+RESULT_TTL = 10  # секунд
+LOCK_POLL = 0.2
+
+# Снимаем лок, только если он всё ещё наш
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class OperationBusy(RuntimeError):
+    pass
+
+
+class UserOps:
+    def __init__(self, lock_ttl: float):
+        self.lock_ttl = lock_ttl
+        self._inflight: dict[tuple[int, str], asyncio.Future] = {}
+        self._results = ExpiringDict(RESULT_TTL)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._lock_users: dict[int, int] = {}
+        self._release = None
+        self.collapsed = 0
+
+    def in_flight(self, user_id: int, op: str) -> bool:
+        return (user_id, op) in self._inflight
+
+    async def run(self, user_id: int, op: str, func):
+        """Выполняет func() как операцию op пользователя user_id (см. docstring модуля)."""
+        key = (user_id, op)
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.collapsed += 1
+            return await asyncio.shield(fut)
+        done = self._results.get(user_id)
+        if done is not None and done[0] == op:
+            self.collapsed += 1
+            return done[1]
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            async with self._user_lock(user_id), self._shared_lock(user_id):
+                # Результат хранится только для последней операции пользователя
+                self._results.pop(user_id)
+                result = await func()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # ожидающих может не быть
+            raise
+        else:
+            fut.set_result(result)
+            self._results.set(user_id, (op, result))
+            return result
+        finally:
+            del self._inflight[key]
+
+    @asynccontextmanager
+    async def _user_lock(self, user_id: int):
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._lock_users[user_id] = self._lock_users.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[user_id] -= 1
+            if not self._lock_users[user_id]:
+                del self._lock_users[user_id], self._locks[user_id]
+
+    @asynccontextmanager
+    async def _shared_lock(self, user_id: int):
+        if not storage.use_redis():
+            yield
+            return
+        redis = storage.get_redis()
+        if self._release is None:
+            self._release = redis.register_script(RELEASE_LUA)
+        key, token = f"userop:{user_id}", uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        while not await redis.set(key, token, nx=True, px=int(self.lock_ttl * 1000)):
+            if time.monotonic() >= deadline:
+                raise OperationBusy("Операция уже выполняется, попробуйте позже")
+            await asyncio.sleep(LOCK_POLL)
+        try:
+            yield
+        finally:
+            await self._release(keys=[key], args=[token])
+
+
+user_ops = UserOps(app_settings.USER_OP_LOCK_TTL)
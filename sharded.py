@@ -0,0 +1,233 @@
+"""
+sharded.py — обработка апдейтов в нескольких процессах (SHARD_WORKERS > 1).
+
+Один приёмник (long polling или webhook) раскладывает апдейты по N воркерам
+по from_user.id % N: апдейты одного пользователя всегда попадают в один процесс
+и обрабатываются по порядку. Воркеры — полноценные экземпляры бота
+(main.setup_dispatcher). Без STORAGE_BACKEND=redis режим не запускается:
+через Redis (services.storage) процессы делят
+- FSM, rate limit и капчу;
+- лимит Bot API и паузу flood-wait (throttle.SharedBucket) — весь TG_RATE
+  доступен любому воркеру, например рассылке;
+- инвалидации кэша ссылок, подписки и недоставляемых чатов (события);
+- онлайн: панели опрашивает воркер 0, остальные получают результат событием.
+Локальными остаются счётчики /stats и адаптивная скорость после RetryAfter.
+Планировщик и обновление куки запускает только воркер 0.
+"""
+import asyncio
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+
+from loguru import logger
+
+QUEUE_SIZE = 1000          # апдейтов в очереди одного воркера
+WORKER_CONCURRENCY = 64    # одновременно обрабатываемых апдейтов в воркере
+POLL_TIMEOUT = 30
+LOAD_REPORT_INTERVAL = 60
+
+
+def shard_key(data: dict) -> int:
+    """Id пользователя (или чата) апдейта; 0 — если апдейт ни к кому не привязан."""
+    for key, event in data.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+# -------------------- Воркер -------------------- #
+
+async def _serve(idx: int, q, processed):
+    import main
+    main.RUN_BACKGROUND = idx == 0
+    main.setup_dispatcher()
+    dp, bot = main.dp, main.bot
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    logger.info("Воркер {} запущен (pid {})", idx, os.getpid())
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    locks: dict[int, asyncio.Lock] = {}
+    waiting: dict[int, int] = {}
+    inflight: set[asyncio.Task] = set()
+
+    async def handle(uid: int, data: dict):
+        # asyncio.Lock отдаёт владение в порядке ожидания — апдейты пользователя идут по очереди
+        lock = locks.setdefault(uid, asyncio.Lock())
+        waiting[uid] = waiting.get(uid, 0) + 1
+        try:
+            async with lock:
+                await dp.feed_raw_update(bot, data)
+        except Exception:
+            logger.exception("Ошибка обработки апдейта {}", data.get("update_id"))
+        finally:
+            waiting[uid] -= 1
+            if not waiting[uid]:
+                del waiting[uid], locks[uid]
+            processed[idx] += 1
+            slots.release()
+
+    try:
+        while True:
+            await slots.acquire()
+            data = await loop.run_in_executor(None, q.get)
+            if data is None:
+                break
+            task = asyncio.create_task(handle(shard_key(data), data))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+    finally:
+        from config import app_settings
+        if inflight:
+            await asyncio.wait(set(inflight), timeout=app_settings.SHUTDOWN_GRACE)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        logger.info("Воркер {} остановлен", idx)
+
+
+def _worker_main(idx: int, q, processed):
+    # Остановкой управляет приёмник: Ctrl+C в терминале не должен рвать воркеры
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from services.logs import setup_logging
+    setup_logging(f"bot.worker{idx}.log")
+    asyncio.run(_serve(idx, q, processed))
+
+
+# -------------------- Приёмник -------------------- #
+
+class ShardRouter:
+    """Раскладывает апдейты по очередям воркеров и считает нагрузку."""
+
+    def __init__(self, queues: list, processed):
+        self.queues = queues
+        self.processed = processed
+        self.dispatched = [0] * len(queues)
+        self._last = (time.monotonic(), [0] * len(queues))
+
+    def try_dispatch(self, data: dict) -> bool:
+        idx = shard_key(data) % len(self.queues)
+        try:
+            self.queues[idx].put_nowait(data)
+        except queue.Full:
+            return False
+        self.dispatched[idx] += 1
+        return True
+
+    async def dispatch(self, data: dict):
+        while not self.try_dispatch(data):
+            await asyncio.sleep(0.05)
+
+    def report(self):
+        now = time.monotonic()
+        last_at, last_done = self._last
+        done = list(self.processed)
+        for i, q in enumerate(self.queues):
+            rate = (done[i] - last_done[i]) / (now - last_at)
+            logger.info(
+                "Воркер {}: принято {}, обработано {}, в очереди {}, {:.1f} апд/с",
+                i, self.dispatched[i], done[i], q.qsize(), rate,
+            )
+        self._last = (now, done)
+
+    def close(self):
+        for q in self.queues:
+            q.put(None)
+
+
+async def _poll(bot, router: ShardRouter, allowed_updates: list[str]):
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates,
+                request_timeout=int(bot.session.timeout + POLL_TIMEOUT),
+            )
+        except Exception as e:
+            logger.warning("Ошибка getUpdates: {}", e)
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            await router.dispatch(update.model_dump(mode="json", exclude_unset=True))
+            offset = update.update_id + 1
+
+
+async def _report_load(router: ShardRouter):
+    while True:
+        await asyncio.sleep(LOAD_REPORT_INTERVAL)
+        router.report()
+
+
+async def run_sharded(dp, bot, workers: int):
+    """Приёмник апдейтов: запускает воркеры и раскладывает им апдейты до сигнала остановки."""
+    from aiohttp import web
+    from config import app_settings
+    from services import storage
+    from webhook import WebhookServer, check_webhook_settings, set_webhook
+
+    storage.require_shared("SHARD_WORKERS > 1")
+    if app_settings.BOT_MODE == "webhook":
+        check_webhook_settings()  # до запуска воркеров
+    ctx = mp.get_context("spawn")
+    queues = [ctx.Queue(maxsize=QUEUE_SIZE) for _ in range(workers)]
+    processed = ctx.Array("q", workers)
+    procs = [
+        ctx.Process(target=_worker_main, args=(i, queues[i], processed),
+                    name=f"bot-worker-{i}", daemon=False)
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    router = ShardRouter(queues, processed)
+    allowed_updates = dp.resolve_used_update_types()
+    logger.info("Запущено {} воркеров, приём: {}", workers, app_settings.BOT_MODE)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = None
+    tasks = [asyncio.create_task(_report_load(router))]
+    if app_settings.BOT_MODE == "webhook":
+        class ShardedWebhook(WebhookServer):
+            async def handle_update(self, request: web.Request) -> web.Response:
+                if not self.authorized(request):
+                    return web.Response(status=401)
+                if not self.accepting or not router.try_dispatch(await request.json()):
+                    return web.Response(status=503)
+                return web.Response()
+
+        server = ShardedWebhook(dp, bot)
+        runner = web.AppRunner(server.build_app())
+        await runner.setup()
+        await set_webhook(bot, allowed_updates)
+        await web.TCPSite(runner, app_settings.WEBHOOK_HOST, app_settings.WEBHOOK_PORT).start()
+    else:
+        tasks.append(asyncio.create_task(_poll(bot, router, allowed_updates)))
+
+    try:
+        await stop.wait()
+    finally:
+        for t in tasks:
+            t.cancel()
+        if runner is not None:
+            server.accepting = False
+            await runner.cleanup()
+        router.report()
+        router.close()
+        deadline = time.monotonic() + app_settings.SHUTDOWN_GRACE + 10
+        for p in procs:
+            await asyncio.to_thread(p.join, max(0, deadline - time.monotonic()))
+            if p.is_alive():
+                logger.warning("Воркер {} не остановился, завершаем принудительно", p.name)
+                p.terminate()
+        await bot.session.close()
@@ -1,4 +1,6 @@
 import asyncio
+from loguru import logger
+from sqlalchemy import select
 from api.http import api_auth, api_clients
 from db import SessionLocal, ReminderSetting
 from config import app_settings, SERVERS_CFG
@@ -6,31 +8,38 @@ from config import app_settings, SERVERS_CFG
 def get_default_server_cfg():
     return SERVERS_CFG["MAIN"]
 
-async def sync_reminders(server_cfg=None):
-    if server_cfg is None:
-        total = 0
-        for scfg in SERVERS_CFG.values():
-            total += await sync_reminders(scfg)
-        return total
+async def _fetch_tg_ids(server_cfg) -> set[int]:
     cookies = await api_auth(server_cfg)
     clients = await api_clients(server_cfg, cookies)
-    count = 0
+    tg_ids = set()
+    for c in clients:
+        tg_id, sep, _ = c.get("email", "").partition("_")
+        if sep and tg_id.isdigit():
+            tg_ids.add(int(tg_id))
+    return tg_ids
+
+async def sync_reminders(server_cfg=None):
+    """
+    Добавляет в БД пользователей, найденных на панелях. Без server_cfg опрашивает
+    все серверы параллельно; недоступный сервер пропускается с предупреждением.
+    """
+    cfgs = {"": server_cfg} if server_cfg is not None else SERVERS_CFG
+    results = await asyncio.gather(*(_fetch_tg_ids(c) for c in cfgs.values()), return_exceptions=True)
+    tg_ids = set()
+    for sid, result in zip(cfgs, results):
+        if isinstance(result, Exception):
+            if server_cfg is not None:
+                raise result
+            logger.warning("Синхронизация: сервер {} недоступен: {}", sid, result)
+            continue
+        tg_ids |= result
+    # Одним запросом вместо s.get на каждого клиента
     async with SessionLocal() as s:
-        for c in clients:
-            email = c.get("email", "")
-            if "_" not in email:
-                continue
-            tg_id, _ = email.split("_", 1)
-            if not tg_id.isdigit():
-                continue
-            tg_id = int(tg_id)
-            obj = await s.get(ReminderSetting, tg_id)
-            if not obj:
-                obj = ReminderSetting(chat_id=tg_id)
-                s.add(obj)
-                count += 1
+        existing = set((await s.execute(select(ReminderSetting.chat_id))).scalars())
+        new_ids = tg_ids - existing
+        s.add_all(ReminderSetting(chat_id=tg_id) for tg_id in new_ids)
         await s.commit()
-    return count
+    return len(new_ids)
 
 if __name__ == "__main__":
     count = asyncio.run(sync_reminders())
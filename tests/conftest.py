@@ -0,0 +1,13 @@
+import os
+import sys
+
+# config.py собирает SERVERS_CFG при импорте — тестам хватит одного фиктивного сервера
+os.environ.setdefault("SERVERS", "T")
+for key, value in {
+    "BASE_URL": "https://panel.invalid", "USERNAME": "u", "PASSWORD": "p", "INBOUNDS": "1,2",
+    "SERVER_DOMAIN": "vpn.invalid", "SERVER_PORT": "443", "FLOW": "xtls-rprx-vision",
+    "PBK": "pbk", "SNI": "sni.invalid", "SID": "ab",
+}.items():
+    os.environ.setdefault(f"T_{key}", value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
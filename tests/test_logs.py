@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("loguru")
+pytest.importorskip("pydantic_settings")
+
+from services.logs import redact
+
+
+@pytest.mark.parametrize("line, secret", [
+    ("bot_token=123:ABC", "123:ABC"),
+    ("TELEGRAM_TOKEN=123:ABC", "123:ABC"),
+    ("access_token: abc.def", "abc.def"),
+    ("password=hunter2, user=x", "hunter2"),
+    ("Authorization: Bearer abc.def", "abc.def"),
+    ("cookies={'3x-ui': 'abc', 'lang': 'ru'} ok", "abc"),
+    ("клиент user@example.com создан", "user@example.com"),
+])
+def test_redact_hides_secret(line, secret):
+    assert secret not in redact(line)
+
+
+def test_redact_keeps_whole_cookie_dict_out_and_tail_in():
+    assert redact("cookies={'a': '1', 'b': '2'} ok") == "cookies=*** ok"
+
+
+def test_redact_leaves_plain_text():
+    assert redact("tokens: 5, clients: 10") == "tokens: 5, clients: 10"
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("loguru")
+pytest.importorskip("pydantic_settings")
+
+from config import app_settings
+from services.membership import MembershipCache
+
+
+@pytest.fixture(autouse=True)
+def channel(monkeypatch):
+    monkeypatch.setattr(app_settings, "CHANNEL_ID", -100)
+
+
+def cache_with(fetch):
+    cache = MembershipCache(positive_ttl=60, negative_ttl=60)
+    calls = []
+
+    async def counted(bot, user_id):
+        calls.append(user_id)
+        return await fetch(len(calls))
+
+    cache._fetch = counted
+    return cache, calls
+
+
+def test_waiters_survive_owner_cancellation():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def fetch(n):
+            if n == 1:
+                await release.wait()  # первый запрос «висит», пока владельца не отменят
+            return True
+
+        cache, calls = cache_with(fetch)
+        owner = asyncio.create_task(cache.is_member(None, 1))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.is_member(None, 1)) for _ in range(3)]
+        await asyncio.sleep(0)
+        owner.cancel()
+        results = await asyncio.gather(*waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return results, len(calls)
+
+    results, fetches = asyncio.run(scenario())
+    assert results == [True, True, True]
+    assert fetches == 2  # отменённый запрос и один повтор на всех ожидающих
+
+
+def test_concurrent_checks_share_one_request():
+    async def scenario():
+        async def fetch(n):
+            await asyncio.sleep(0.01)
+            return True
+
+        cache, calls = cache_with(fetch)
+        results = await asyncio.gather(*(cache.is_member(None, 1) for _ in range(5)))
+        return results, len(calls)
+
+    assert asyncio.run(scenario()) == ([True] * 5, 1)
+
+
+def test_failed_lookup_is_not_cached():
+    async def scenario():
+        async def fetch(n):
+            return None if n == 1 else True
+
+        cache, calls = cache_with(fetch)
+        return await cache.is_member(None, 1), await cache.is_member(None, 1), len(calls)
+
+    assert asyncio.run(scenario()) == (False, True, 2)
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("aiocache")
+pytest.importorskip("pydantic_settings")
+
+from config import app_settings, ServerSettings
+from services.server_manager import place_inbound
+
+
+def cfg(*ids):
+    return SimpleNamespace(inbound_ids=list(ids))
+
+
+def client(inbound_id, up=0, down=0):
+    return {"inbound_id": inbound_id, "up": up, "down": down}
+
+
+@pytest.fixture
+def balance(monkeypatch):
+    return lambda mode: monkeypatch.setattr(app_settings, "INBOUND_BALANCE", mode)
+
+
+def test_count_picks_least_populated(balance):
+    balance("count")
+    assert place_inbound(cfg(1, 2, 3), [client(1), client(1), client(2), client(3), client(3)]) == 2
+
+
+def test_count_tie_goes_to_first_in_config(balance):
+    balance("count")
+    assert place_inbound(cfg(3, 1, 2), [client(1), client(2), client(3)]) == 3
+    assert place_inbound(cfg(2, 1), []) == 2
+
+
+def test_traffic_picks_least_loaded_by_bytes(balance):
+    balance("traffic")
+    clients = [client(1, up=10), client(2, up=5, down=100), client(2), client(3, down=50)]
+    assert place_inbound(cfg(1, 2, 3), clients) == 1
+
+
+def test_traffic_tie_falls_back_to_count_then_order(balance):
+    balance("traffic")
+    assert place_inbound(cfg(1, 2), [client(1), client(1), client(2)]) == 2
+    assert place_inbound(cfg(2, 1), [client(1), client(2)]) == 2
+
+
+def test_respects_max_inbounds_and_ignores_foreign(balance, monkeypatch):
+    balance("count")
+    monkeypatch.setattr(app_settings, "MAX_INBOUNDS", 2)
+    assert place_inbound(cfg(1, 2, 3), [client(1), client(2), client(9)]) == 1
+
+
+def test_no_inbounds_is_an_error(balance, monkeypatch):
+    monkeypatch.setattr(app_settings, "MAX_INBOUNDS", 0)
+    with pytest.raises(RuntimeError):
+        place_inbound(cfg(1, 2), [])
+
+
+@pytest.mark.parametrize("value", ["", " , ", "1,a"])
+def test_inbounds_validated_at_config_time(value):
+    with pytest.raises(ValueError):
+        ServerSettings(BASE_URL="x", USERNAME="u", PASSWORD="p", INBOUNDS=value, SERVER_DOMAIN="d",
+                       SERVER_PORT=443, FLOW="f", PBK="k", SNI="s", SID="i")
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("loguru")
+pytest.importorskip("pydantic_settings")
+
+from services.storage import MemoryRateLimitBackend, RedisRateLimitBackend
+
+
+def memory():
+    return MemoryRateLimitBackend(captcha_ttl=60)
+
+
+def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # Lua-скрипты в fakeredis
+    return RedisRateLimitBackend(fakeredis.FakeAsyncRedis(), captcha_ttl=60)
+
+
+@pytest.fixture(params=[memory, redis], ids=["memory", "redis"])
+def backend(request):
+    return request.param()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_hit_allows_up_to_limit(backend):
+    async def scenario():
+        return [await backend.hit("msg", 1, window=60, limit=3) for _ in range(4)]
+
+    assert run(scenario()) == [True, True, True, False]
+
+
+def test_hit_counts_per_user_and_kind(backend):
+    async def scenario():
+        await backend.hit("msg", 1, window=60)
+        return (await backend.hit("msg", 1, window=60), await backend.hit("msg", 2, window=60),
+                await backend.hit("cb", 1, window=60))
+
+    assert run(scenario()) == (False, True, True)
+
+
+def test_window_slides(backend):
+    async def scenario():
+        first = await backend.hit("msg", 1, window=0.1)
+        blocked = await backend.hit("msg", 1, window=0.1)
+        await asyncio.sleep(0.15)
+        return first, blocked, await backend.hit("msg", 1, window=0.1)
+
+    assert run(scenario()) == (True, False, True)
+
+
+def test_captcha_roundtrip(backend):
+    async def scenario():
+        await backend.set_captcha(1, 42)
+        got = await backend.get_captcha(1)
+        await backend.clear_captcha(1)
+        return got, await backend.get_captcha(1), await backend.get_captcha(2)
+
+    assert run(scenario()) == (42, None, None)
+
+
+def test_redis_limit_is_shared_between_instances():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    a = RedisRateLimitBackend(fakeredis.FakeAsyncRedis(server=server), captcha_ttl=60)
+    b = RedisRateLimitBackend(fakeredis.FakeAsyncRedis(server=server), captcha_ttl=60)
+
+    async def scenario():
+        return await a.hit("msg", 1, window=60), await b.hit("msg", 1, window=60)
+
+    assert run(scenario()) == (True, False)
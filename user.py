@@ -2,7 +2,7 @@ from aiogram import types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.filters import Command
-from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, CopyTextButton
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, CopyTextButton, ChatMemberUpdated
 from keyboards import user_keyboard
 from locales import t
 from config import is_admin, app_settings
@@ -13,6 +13,10 @@ from services import reminders
 from services.instructions import send_or_edit
 from services.core import get_best_server_cfg, server_manager, delete_user_profile, get_user_traffic, find_user_server
 from services.telegram_utils import safe_send
+from services.link_cache import links
+from services.inventory import inventory
+from services.membership import membership, is_member_status
+from services.user_ops import user_ops
 from api.http import api_auth, api_clients, api_create_client, api_delete_client, api_inbounds_list, api_traffic, api_onlines, build_vless
 from httpx import HTTPStatusError
 import os
@@ -21,19 +25,16 @@ class UserFSM(StatesGroup):
     waiting_name = State()
 
 def register_user_handlers(dp, bot):
-    @dp.message(Command("start"))
+    @dp.message(Command("start"), flags={"panel": True})
     async def user_start(msg: types.Message, state: FSMContext):
-        from services.core import find_user_server, server_manager
-        prefix = f"{msg.from_user.id}_"
-        cfg, user = await find_user_server(prefix)
-        if user:
-            link = build_vless(cfg, user["email"])
-            kb = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Скопировать", copy_text=CopyTextButton(text=link))]
-                ]
-            )
-            await safe_send(msg.answer, f"<code>{link}</code>", disable_web_page_preview=True, reply_markup=kb)
+        from services.core import find_user, server_manager
+        cached = links.get(msg.from_user.id)
+        if cached is None:
+            sid, user = await find_user(f"{msg.from_user.id}_")
+            if user:
+                cached = links.put(msg.from_user.id, sid, user["email"])
+        if cached:
+            await safe_send(msg.answer, f"<code>{cached.link}</code>", disable_web_page_preview=True, reply_markup=cached.keyboard)
             await send_or_edit(msg.chat.id, bot)
             await state.clear()
             return
@@ -49,14 +50,7 @@ def register_user_handlers(dp, bot):
             return
         
         # --- Проверка подписки на канал ---
-        CHANNEL_ID = int(os.getenv("CHANNEL_ID"))
-        CHANNEL_URL = os.getenv("CHANNEL_URL", "https://t.me/+2UXi1T8ZKEsyNGMy")
-        try:
-            member = await bot.get_chat_member(CHANNEL_ID, msg.from_user.id)
-            if member.status not in ("member", "administrator", "creator"):
-                raise Exception("not subscribed")
-        except Exception:
-            from config import app_settings
+        if not await membership.is_member(bot, msg.from_user.id):
             support_url = f"https://t.me/{app_settings.SUPPORT_USERNAME.lstrip('@')}"
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
@@ -77,7 +71,7 @@ def register_user_handlers(dp, bot):
         await state.update_data(intro={"chat_id": sent.chat.id, "msg_id": sent.message_id})
         await state.set_state(UserFSM.waiting_name)
 
-    @dp.message(UserFSM.waiting_name)
+    @dp.message(UserFSM.waiting_name, flags={"panel": True})
     async def process_name(msg: types.Message, state: FSMContext):
         from services.core import ensure_user_profile
         name = msg.text.strip()
@@ -87,22 +81,21 @@ def register_user_handlers(dp, bot):
             notify_lower = True
         if not re.fullmatch(r"[a-z]{3,20}", name):
             return await safe_send(msg.answer, "❗️ Имя должно быть 3–20 английских букв (a-z).")
-        if notify_lower:
+        # Повтор, пока ключ создаётся, присоединяется к той же операции и получает тот же ключ
+        duplicate = user_ops.in_flight(msg.from_user.id, "provision")
+        if notify_lower and not duplicate:
             await safe_send(msg.answer, f"ℹ️ Имя: <code>{name}</code>")
-        gen_msg = await safe_send(msg.answer, "⏳ Генерирую ключ…")
+        gen_msg = await safe_send(msg.answer, "⏳ Ключ уже создаётся, подождите…" if duplicate else "⏳ Генерирую ключ…")
         gen_msg_id = gen_msg.message_id
         gen_chat_id = gen_msg.chat.id
         await bot.send_chat_action(msg.chat.id, "typing")
         try:
-            cfg, email = await ensure_user_profile(msg.from_user.id, name)
-            link = build_vless(cfg, email)
-            await safe_send(gen_msg.edit_text, "✅ <b>Ключ готов.</b>")
-            kb = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="📋 Скопировать", copy_text=CopyTextButton(text=link))]
-                ]
+            sid, email = await user_ops.run(
+                msg.from_user.id, "provision", lambda: ensure_user_profile(msg.from_user.id, name)
             )
-            await safe_send(msg.answer, f"<code>{link}</code>", disable_web_page_preview=True, reply_markup=kb)
+            cached = links.put(msg.from_user.id, sid, email)
+            await safe_send(gen_msg.edit_text, "✅ <b>Ключ готов.</b>")
+            await safe_send(msg.answer, f"<code>{cached.link}</code>", disable_web_page_preview=True, reply_markup=cached.keyboard)
             await send_or_edit(msg.chat.id, bot)
         except RuntimeError as e:
             await safe_send(gen_msg.edit_text, f"⛔ {e}")
@@ -115,7 +108,7 @@ def register_user_handlers(dp, bot):
         finally:
             await state.clear()
 
-    @dp.callback_query(F.data == "user_traffic")
+    @dp.callback_query(F.data == "user_traffic", flags={"panel": True})
     async def user_traffic(query: CallbackQuery):
         await query.answer()
         try:
@@ -148,16 +141,18 @@ def register_user_handlers(dp, bot):
         except Exception as e:
             await safe_send(query.message.answer, f"Ошибка получения трафика: {e}", reply_markup=user_keyboard())
 
-    @dp.callback_query(F.data == "user_menu")
+    @dp.callback_query(F.data == "user_menu", flags={"panel": True})
     async def user_menu(query: CallbackQuery):
         await query.answer()
-        from services.core import find_user_server
-        prefix = f"{query.from_user.id}_"
-        cfg, user = await find_user_server(prefix)
-        if user:
-            link = build_vless(cfg, user["email"])
+        from services.core import find_user
+        cached = links.get(query.from_user.id)
+        if cached is None:
+            sid, user = await find_user(f"{query.from_user.id}_")
+            if user:
+                cached = links.put(query.from_user.id, sid, user["email"])
+        if cached:
             await safe_send(query.message.answer,
-                f"<code>{link}</code>",
+                f"<code>{cached.link}</code>",
                 disable_web_page_preview=True
             )
             await send_or_edit(query.from_user.id, bot)
@@ -178,22 +173,31 @@ def register_user_handlers(dp, bot):
         await reminders.toggle_enabled(msg.chat.id)
         await send_or_edit(msg.chat.id, bot)
 
-    @dp.callback_query(F.data == "delete_profile")
+    @dp.callback_query(F.data == "delete_profile", flags={"panel": True})
     async def delete_profile(query: CallbackQuery):
+        if user_ops.in_flight(query.from_user.id, "delete"):
+            return await query.answer("⏳ Профиль уже удаляется…")
         await query.answer()
-        try:
+
+        async def delete_all() -> bool:
             from services.core import server_manager
+            links.invalidate(query.from_user.id)
             prefix = f"{query.from_user.id}_"
             found = False
             for sid, cfg in server_manager.cfgs.items():
                 clients = await server_manager.list_clients(sid)
                 user_clients = [c for c in clients if c["email"].startswith(prefix)]
-                inbound_id = int(cfg.INBOUNDS.split(",")[0]) if hasattr(cfg, 'INBOUNDS') else 1
                 for c in user_clients:
-                    await server_manager.delete_client(sid, inbound_id, c["email"])
+                    # inbound клиента из списка панели, а не первый из INBOUNDS
+                    await server_manager.delete_client(sid, c["inbound_id"], c["uuid"] or c["email"])
+                    inventory.remove(sid, c["email"])
                     found = True
                 if found:
                     await server_manager.invalidate_cache(sid, "clients")
+            return found
+
+        try:
+            found = await user_ops.run(query.from_user.id, "delete", delete_all)
             if found:
                 await query.message.answer("✅ Ваш профиль и все ключи удалены.")
             else:
@@ -261,13 +265,7 @@ def register_user_handlers(dp, bot):
     # --- Новый callback для проверки подписки ---
     @dp.callback_query(F.data == "check_subscription")
     async def check_subscription_callback(call: CallbackQuery, state: FSMContext):
-        CHANNEL_ID = int(os.getenv("CHANNEL_ID"))
-        CHANNEL_URL = os.getenv("CHANNEL_URL")
-        try:
-            member = await bot.get_chat_member(CHANNEL_ID, call.from_user.id)
-            if member.status not in ("member", "administrator", "creator"):
-                raise Exception("not subscribed")
-        except Exception:
+        if not await membership.is_member(bot, call.from_user.id):
             await call.answer(
                 "⏳ Вас пока не приняли в канал. Попробуйте позже 😊",
                 show_alert=True
@@ -279,6 +277,12 @@ def register_user_handlers(dp, bot):
         await state.set_state(UserFSM.waiting_name)
         await call.message.delete()
 
+    # Вступление/выход из канала (бот должен быть админом канала)
+    if app_settings.CHANNEL_ID is not None:
+        @dp.chat_member(F.chat.id == app_settings.CHANNEL_ID)
+        async def channel_member_changed(event: ChatMemberUpdated):
+            membership.update(event.new_chat_member.user.id, is_member_status(event.new_chat_member))
+
 async def ask_support_reminder(chat_id: int, bot):
     setting = await reminders.get_setting(chat_id)
     if setting and setting.asked:
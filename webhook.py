@@ -0,0 +1,117 @@
+"""
+webhook.py — приём апдейтов через webhook (aiohttp) с корректной остановкой.
+
+POST {WEBHOOK_PATH}  — апдейты Telegram, проверяется X-Telegram-Bot-Api-Secret-Token
+GET  /healthz        — 200, пока принимаем апдейты; 503 во время остановки
+"""
+import asyncio
+import hmac
+import signal
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from loguru import logger
+
+from config import app_settings
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def check_webhook_settings():
+    """Без публичного адреса и секрета webhook не запускаем: иначе апдейты может прислать кто угодно."""
+    missing = [name for name in ("WEBHOOK_URL", "WEBHOOK_SECRET") if not getattr(app_settings, name)]
+    if missing:
+        raise RuntimeError(f"BOT_MODE=webhook: не заданы {', '.join(missing)}")
+
+
+async def set_webhook(bot: Bot, allowed_updates: list[str]):
+    await bot.set_webhook(
+        app_settings.WEBHOOK_URL.rstrip("/") + app_settings.WEBHOOK_PATH,
+        secret_token=app_settings.WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+        max_connections=app_settings.WEBHOOK_MAX_CONCURRENCY,
+    )
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot):
+        self.dp = dp
+        self.bot = bot
+        self.accepting = True
+        self._sem = asyncio.Semaphore(app_settings.WEBHOOK_MAX_CONCURRENCY)
+        self._max_pending = app_settings.WEBHOOK_MAX_CONCURRENCY * 4
+        self._inflight: set[asyncio.Task] = set()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(app_settings.WEBHOOK_PATH, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    @staticmethod
+    def authorized(request: web.Request) -> bool:
+        token = request.headers.get(SECRET_HEADER, "")
+        return hmac.compare_digest(token.encode(), app_settings.WEBHOOK_SECRET.encode())
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not self.authorized(request):
+            return web.Response(status=401)
+        # Во время остановки и при переполнении — не 2xx: Telegram доставит апдейт повторно
+        if not self.accepting or len(self._inflight) >= self._max_pending:
+            return web.Response(status=503)
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        task = asyncio.create_task(self._process(update))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        async with self._sem:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Ошибка обработки апдейта {}", update.update_id)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        status = 200 if self.accepting else 503
+        return web.json_response(
+            {"status": "ok" if self.accepting else "draining", "inflight": len(self._inflight)},
+            status=status,
+        )
+
+    async def drain(self, timeout: float):
+        """Перестаёт принимать апдейты и ждёт завершения уже начатых хендлеров."""
+        self.accepting = False
+        if self._inflight:
+            logger.info("Дожидаемся {} хендлеров…", len(self._inflight))
+            done, pending = await asyncio.wait(set(self._inflight), timeout=timeout)
+            if pending:
+                logger.warning("Не дождались {} хендлеров за {} с", len(pending), timeout)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Тот же жизненный цикл, что у start_polling: startup → приём апдейтов → shutdown."""
+    check_webhook_settings()
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, app_settings.WEBHOOK_HOST, app_settings.WEBHOOK_PORT)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    await set_webhook(bot, dp.resolve_used_update_types())
+    await site.start()
+    logger.info("Webhook слушает {}:{}{}", app_settings.WEBHOOK_HOST, app_settings.WEBHOOK_PORT, app_settings.WEBHOOK_PATH)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        # webhook не удаляем: за балансировщиком остаются другие экземпляры
+        await server.drain(app_settings.SHUTDOWN_GRACE)
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
@@ -0,0 +1,70 @@
+"""
+worker.py — Celery-воркер для тяжёлых админских задач (рассылки, синхронизация,
+отчёты по трафику, массовое создание клиентов).
+
+    celery -A worker worker -Q celery -c 4
+    celery -A worker worker -Q bulk -c 1
+
+Брокер — CELERY_BROKER_URL: Redis или локальный SQLite (kombu SQLAlchemy transport).
+Прогресс воркер пишет прямо в сообщение админа через Bot API.
+Нужен STORAGE_BACKEND=redis: лимит Bot API общий с ботом, пометки
+недоставляемых чатов доходят до бота событиями (services.storage).
+
+Задачи с повторяемым результатом (синхронизация, отчёт, перенос клиентов
+с состоянием в БД) подтверждаются после выполнения и при падении воркера
+выполнятся заново; рассылка и массовое создание — не более одного раза
+(jobs.AT_MOST_ONCE), иначе получатели увидят дубли.
+"""
+import asyncio
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from celery import Celery
+from celery.signals import worker_process_init
+from loguru import logger
+
+from config import app_settings
+from services import storage
+from services.telegram_utils import bot_session
+from services.logs import setup_logging
+
+celery_app = Celery("vpnbot", broker=app_settings.CELERY_BROKER_URL, backend=app_settings.CELERY_RESULT_BACKEND)
+celery_app.conf.update(
+    worker_prefetch_multiplier=1,
+    task_ignore_result=True,
+)
+
+# Один event loop и один Bot на процесс воркера: модульные очереди и локи
+# (send_queue, flood_control) привязываются к loop при первом использовании
+_loop: asyncio.AbstractEventLoop | None = None
+_bot: Bot | None = None
+
+
+@worker_process_init.connect
+def init_worker_process(**_):
+    global _loop, _bot
+    storage.require_shared("USE_WORKERS")
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    setup_logging("bot.celery.log")
+    storage.start_shared(listen=False)
+    _bot = Bot(token=app_settings.TELEGRAM_TOKEN, session=bot_session(), default=DefaultBotProperties(parse_mode="HTML"))
+
+
+def _run(name: str, chat_id: int, message_id: int, *args):
+    from services.jobs import JOBS
+    from services.progress import MessageRef
+    if _loop is None:  # --pool=solo: сигнал init не приходит
+        init_worker_process()
+    logger.info("Воркер: задача {} для чата {}", name, chat_id)
+    _loop.run_until_complete(JOBS[name](_bot, MessageRef(_bot, chat_id, message_id), *args))
+
+
+@celery_app.task(name="worker.run_job", acks_late=True)
+def run_job(name: str, chat_id: int, message_id: int, *args):
+    _run(name, chat_id, message_id, *args)
+
+
+@celery_app.task(name="worker.run_job_once", acks_late=False)
+def run_job_once(name: str, chat_id: int, message_id: int, *args):
+    _run(name, chat_id, message_id, *args)